@@ -8,16 +8,38 @@ The code in this script uses the Swedish words "kommun"/"kommuner"
 County/Counties (and not län/län) are used however.
 """
 import json
+import gzip
+import hashlib
+import threading
+import time
+import unicodedata
+import urllib.parse
+from functools import lru_cache
+from typing import Tuple
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
+import flask
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
+from simplify_maps import RESOLUTION_LEVELS, decode_topology
+from data_bundle import open_bundle
+
+# How long each part of starting the web-app took (in seconds), see /startup-stats.
+# "import" is filled in as the rest of this file runs, "lazy_loads" as each piece of data is first used.
+# The imports above aren't included, use "python -X importtime app.py" to time those.
+startup_start = time.perf_counter()
+startup_times = {"import": {}, "lazy_loads": {}}
+
+
+def record_startup_time(part: str) -> None:
+    """Record how long a part of importing this file took (since the previous part ended)."""
+    startup_times["import"][part] = round(
+        time.perf_counter() - startup_start - sum(startup_times["import"].values()), 4)
 
 
 ####################################################################
@@ -195,108 +217,539 @@ faq_text_6 = html.P([
 ###################### Part2 - Data Preperation ####################
 ####################################################################
 
-# Read in the prepared dfs, dicts and simplified maps (made with mapshaper)
-dfs = {}
-dfs["rent_kommun"] = pd.read_csv("assets/median_rent_kommuner_cleaned.csv")
-dfs["rent_county"] = pd.read_csv("assets/median_rent_counties_cleaned.csv")
-dfs["new_rent_kommun"] = pd.read_csv(
-    "assets/median_new_rent_kommuner_cleaned.csv")
-dfs["new_rent_county"] = pd.read_csv(
-    "assets/median_new_rent_counties_cleaned.csv")
+def add_map_label(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of df with a "Map Label" column, the text shown when hovering over a choropleth map.
+    Used to label missing data (otherwise they will show up on the map as "0 SEK").
+    """
+    rent = df["Median Rent (SEK)"]
+    return df.assign(**{"Map Label": np.where(
+        rent > 0, "Median Cost: " + rent.astype(int).astype(str) + " SEK", "Missing Data")})
 
-with open("assets/kommuner_map_low_res.json") as infile:
-    kommuner_map = json.load(infile)
-with open("assets/counties_map_low_res.json") as infile:
-    counties_map = json.load(infile)
 
-with open("assets/county_kommun_mapping.json", "r") as json_file:
-    county_kommun_mapping = json.load(json_file)
-with open("assets/kommun_info_texts.json", "r") as json_file:
-    kommun_info_texts = json.load(json_file)
-with open("assets/kommun_urls.json", "r") as json_file:
-    kommun_urls = json.load(json_file)
+class LazyData(dict):
+    """
+    dict that loads each value the first time it is used (and then keeps it), so nothing is
+    loaded while the web-app starts and each worker only loads what the pages it serves need.
+    Values are made by the function registered for their key (see loader).
+    How long each one took to load (including anything it loaded) is recorded in startup_times["lazy_loads"].
 
+    Parameters
+    ----------
+    name : str
+        Name of the dict, used in startup_times.
+    """
 
-################ Data prep for overview page ################
-# Define Top 10 most expensive and least expensive kommuner to live in.
-kommun_bar_df = dfs["rent_kommun"][dfs["rent_kommun"]
-                                   ["Year"].apply(lambda x: x == 2022)]
-# remove missing values
-kommun_bar_df = kommun_bar_df[~(kommun_bar_df["Median Rent (SEK)"] <= 0)]
-kommun_bar_df = kommun_bar_df.sort_values(
-    by=["Median Rent (SEK)"], ascending=True, ignore_index=True)
-kommun_bar_df = kommun_bar_df.iloc[np.r_[0:10, -10:0]]  # filter for plotting.
-
-# As there are 21 counties, show all on the bar graph but sort them first.
-county_bar_df = dfs["rent_county"][dfs["rent_county"]
-                                   ["Year"].apply(lambda x: x == 2022)]
-# remove missing values
-county_bar_df = county_bar_df[~(county_bar_df["Median Rent (SEK)"] <= 0)]
-county_bar_df = county_bar_df.sort_values(
-    by=["Median Rent (SEK)"], ascending=True, ignore_index=True)
-county_bar_df["county"] = county_bar_df["county"].str.replace(" county", "")
-
-
-def inflation_adjust(unadj_value: float, year: int) -> float:
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.loaders = {}
+        # each key has its own lock, so loading one value doesn't hold up loading the others.
+        self._lock = threading.Lock()  # guards _key_locks.
+        self._key_locks = {}
+
+    def loader(self, *keys):
+        """Decorator registering a function to load the values of these keys, it is passed the key."""
+        def register(func):
+            for key in keys:
+                self.loaders[key] = func
+            return func
+        return register
+
+    def __missing__(self, key):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            if dict.__contains__(self, key):  # loaded by another thread while waiting.
+                return dict.__getitem__(self, key)
+            start = time.perf_counter()
+            value = self.loaders[key](key)
+            self[key] = value
+            startup_times["lazy_loads"][f"{self.name}[{key!r}]"] = round(
+                time.perf_counter() - start, 4)
+            return value
+
+
+# dfs holds the rent tables (and versions derived from them), data everything else.
+dfs = LazyData("dfs")
+data = LazyData("data")
+
+
+@data.loader("bundle")
+def load_bundle(key: str):
+    """All the prepared dfs, dicts and simplified maps are read from one memory-mapped
+    file (see data_bundle.py), which must be built from the "assets" folder before starting the web-app."""
+    return open_bundle()
+
+
+# opening the bundle is cheap (nothing is read until it is used), so do it now, to fail when the
+# web-app starts rather than on the first request if the bundle hasn't been built.
+data["bundle"]
+
+
+@dfs.loader("rent_kommun", "rent_county", "new_rent_kommun", "new_rent_county")
+def load_rent_df(df_name: str) -> pd.DataFrame:
+    """Rent tables (made by prepare_rent_data.py), the kommun/county names are categorical.
+    The columns are read-only views of the bundle (shared by all workers), so must not be changed."""
+    return data["bundle"].get_dataframe(df_name)
+
+
+# Split each df up by region, relation id and year once, so the callbacks can look up
+# the rows they need (see get_rows below) instead of scanning through the whole df each time.
+# Only the row numbers are kept, copies of the rows would be kept in each worker's own memory.
+rows_index = LazyData("rows_index")
+
+
+@rows_index.loader("rent_kommun", "rent_county", "new_rent_kommun", "new_rent_county")
+def build_rows_index(df_name: str) -> dict:
+    """(column, value): row numbers of the matching rows, for each region, relation id and year in a df."""
+    df_rows_index = {}
+    kommun_or_county = df_name.split("_")[-1]
+    for column in [kommun_or_county, "Relation", "Year"]:
+        for value, row_numbers in dfs[df_name].groupby(column, sort=False).indices.items():
+            df_rows_index[(column, value)] = row_numbers
+    return df_rows_index
+
+
+def get_rows(df_name: str, column: str, value) -> pd.DataFrame:
     """
-    Adjust values for inflation, with 2016 set as the base year.
+    Helper function to return all rows of a df with a given region, relation id or year.
 
     Parameters
     ----------
-    unadj_value : int
-        unadjusted value to convert.
+    df_name : str
+        Key of the df in dfs, e.g. "rent_kommun".
 
-    year : int
-        Year to calculate inflation against.
+    column : str
+        Column to match on, either "kommun"/"county", "Relation" or "Year".
+
+    value :
+        Value to match, e.g. "Ale", 935506 or 2022.
+
+    Returns
+    -------
+    pd.DataFrame
+        Matching rows, empty if there are none.
+    """
+    return dfs[df_name].take(rows_index[df_name].get((column, value), []))
+
+
+@data.loader("stats_kommun", "stats_county")
+def load_stats(key: str) -> pd.DataFrame:
+    """Ranks and yearly changes for each kommun/county and year (made by prepare_rent_data.py)."""
+    return data["bundle"].get_dataframe(key).set_index([key.split("_")[1], "Year"])
+
+
+@data.loader("map_levels")
+def find_map_levels(key: str) -> dict:
+    """Maps are stored as TopoJSON (made by simplify_maps.py) at several resolution levels.
+    Every counties level is kept in the repo, but only the low res kommuner map is (the others appear
+    after running get_geojson_data.py), so until then pick_map_level falls back to it at every zoom."""
+    return {
+        map_name: [level for level in RESOLUTION_LEVELS
+                   if f"{map_name}_map_{level}" in data["bundle"].entries]
+        for map_name in ("kommuner", "counties")
+    }
+
+# If True, the choropleths are given a url to each map instead of the map itself.
+# The browser then downloads each map only once and the callbacks only send the per-region values.
+# Set to False to embed the maps in each figure (e.g. to save a figure as a standalone html file).
+geojson_as_url = True
+
+
+@lru_cache(maxsize=None)
+def load_decoded_map(map_name: str, level: str) -> dict:
+    """Decode a map's TopoJSON to geojson, once per resolution level (see load_map).
+    Only the levels that are used are decoded, and the parsed TopoJSON isn't kept once decoded.
+    The decoded map is a Python object, so is kept in each worker's own memory (not the bundle)."""
+    return decode_topology(data["bundle"].get_json(f"{map_name}_map_{level}"))
+
+
+def load_map(map_name: str, level: str = "low_res", ids: tuple = None) -> dict:
+    """
+    Decode a map to geojson for the choropleths.
+
+    Parameters
+    ----------
+    map_name : str
+        "kommuner" or "counties".
+
+    level : str
+        Resolution level, one of data["map_levels"][map_name].
+
+    ids : tuple
+        Relation numbers of the kommuner/counties to keep, all are kept if None.
+
+    Returns
+    -------
+    dict
+        geojson FeatureCollection (shared with other callers, so it must not be changed).
+    """
+    geojson_map = load_decoded_map(map_name, level)
+    if ids is not None:
+        ids = set(ids)
+        geojson_map = dict(geojson_map, features=[feature for feature in geojson_map["features"]
+                                                  if feature["id"] in ids])
+    return geojson_map
+
+
+def get_county_relations(county: str) -> tuple:
+    """Relation numbers of the kommuner in a county (the part of the kommuner map sent for it)."""
+    return tuple(sorted(data["kommun_to_relation"][kommun] for kommun in data["county_kommun_mapping"][county]
+                        if kommun in data["kommun_to_relation"]))
+
+
+def pick_map_level(map_name: str, zoom: float = None) -> str:
+    """
+    Pick the lowest resolution level of a map that still looks sharp at a zoom level,
+    i.e. where the simplification tolerance is less than one pixel.
+    Falls back to the highest resolution available. If zoom is None, the lowest is used.
+    """
+    # coarsest level first.
+    levels = sorted(data["map_levels"][map_name],
+                    key=RESOLUTION_LEVELS.get, reverse=True)
+    if zoom is None:
+        return levels[0]
+    degrees_per_pixel = 360 / (512 * 2 ** zoom)  # width of a mapbox pixel at the equator.
+    for level in levels:
+        if RESOLUTION_LEVELS[level] <= degrees_per_pixel:
+            return level
+    return levels[-1]
+
+
+@lru_cache(maxsize=128)
+def build_map_file(map_name: str, level: str, county: str = None) -> tuple:
+    """
+    Helper function to prepare a map (or the kommuner of one county) for serve_map.
+    Only a fixed set of files can be made (one per map, level and county), so clients can't
+    fill the cache with made up requests.
 
     Returns
     -------
-    float
-        value adjusted for inflation.
+    tuple
+        (file contents, gzipped file contents, ETag).
+        The ETag is also added to the url so a refreshed map gets a new url.
     """
-    # From: https://www.scb.se/en/finding-statistics/statistics-by-subject-area/prices-and-consumption/consumer-price-index/consumer-price-index-cpi/pong/tables-and-graphs/consumer-price-index-cpi/cpi-fixed-index-numbers-1980100/
-    # For 2021, the average from Jan to Aug was used (only data available at the time).
-    # UPDATE - now using all of 2021 monnths are Jan to Sep average for 2022.
-
-    cpi_rates = {"2016": 316.43, "2017": 322.11, "2018": 328.40,
-                 "2019": 334.26, "2020": 335.92, "2021": 343.19, "2022": 366.11}
-
-    if year == 2016:
-        adj_value = (unadj_value * cpi_rates["2016"]) / cpi_rates["2016"]
-    elif year == 2017:
-        adj_value = (unadj_value * cpi_rates["2017"]) / cpi_rates["2016"]
-    elif year == 2018:
-        adj_value = (unadj_value * cpi_rates["2018"]) / cpi_rates["2016"]
-    elif year == 2019:
-        adj_value = (unadj_value * cpi_rates["2019"]) / cpi_rates["2016"]
-    elif year == 2020:
-        adj_value = (unadj_value * cpi_rates["2020"]) / cpi_rates["2016"]
-    elif year == 2021:
-        adj_value = (unadj_value * cpi_rates["2021"]) / cpi_rates["2016"]
-    elif year == 2022:
-        adj_value = (unadj_value * cpi_rates["2022"]) / cpi_rates["2016"]
+    ids = get_county_relations(county) if county is not None else None
+    body = json.dumps(load_map(map_name, level, ids),
+                      separators=(",", ":")).encode("utf-8")
+    return body, gzip.compress(body), hashlib.md5(body).hexdigest()
+
+
+@app.server.route("/maps/<map_name>.json")
+def serve_map(map_name):
+    """
+    Serve a map file that browsers can cache, repeat requests get a "304 Not Modified".
+    The map is sent gzipped to any browser that accepts it.
+    Query parameters: level (resolution level, default low_res) and
+    county (only send the kommuner of this county, kommuner map only).
+    """
+    level = flask.request.args.get("level", "low_res")
+    if map_name not in data["map_levels"] or level not in data["map_levels"][map_name]:
+        flask.abort(404)
+    county = flask.request.args.get("county")
+    if county is not None and (map_name != "kommuner" or county not in data["county_kommun_mapping"]):
+        flask.abort(404)
+
+    body, gzipped_body, etag = build_map_file(map_name, level, county)
+    if flask.request.accept_encodings["gzip"]:
+        response = flask.Response(gzipped_body, mimetype="application/json")
+        response.content_encoding = "gzip"
     else:
+        response = flask.Response(body, mimetype="application/json")
+    response.vary.add("Accept-Encoding")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000  # 1 year, url changes with the map.
+    return response.make_conditional(flask.request)
+
+
+def get_map_geojson(map_name: str, zoom: float = None, county: str = None):
+    """
+    Get the geojson argument for a choropleth, at the resolution level suited to its zoom.
+
+    Parameters
+    ----------
+    map_name : str
+        "kommuner" or "counties".
+
+    zoom : float
+        mapbox zoom level of the figure, None for the whole of Sweden.
+
+    county : str
+        Only send the kommuner of this county (kommuner map only), all are sent if None.
+
+    Returns
+    -------
+    str or dict
+        url of the map if geojson_as_url, otherwise the map itself.
+    """
+    level = pick_map_level(map_name, zoom)
+    if not geojson_as_url:
+        return load_map(map_name, level, get_county_relations(county) if county is not None else None)
+
+    etag = build_map_file(map_name, level, county)[2]
+    query = f"level={level}&v={etag}"
+    if county is not None:
+        query = f"county={urllib.parse.quote(county)}&" + query
+    return app.get_relative_path(f"/maps/{map_name}.json?{query}")
+
+
+@lru_cache(maxsize=64)
+def get_map_view(map_name: str, ids: tuple) -> Tuple[dict, float]:
+    """
+    Centre and zoom level that fit these kommuner/counties in a mapbox figure (~475px high).
+
+    Returns
+    -------
+    center : dict
+        {"lat": ..., "lon": ...}
+
+    zoom : float
+        mapbox zoom level.
+    """
+    points = np.concatenate([np.asarray(ring)[:, :2] for feature in load_map(map_name, ids=ids)["features"]
+                             for polygon in feature["geometry"]["coordinates"] for ring in polygon])
+    (lon_min, lat_min), (lon_max, lat_max) = points.min(axis=0), points.max(axis=0)
+    center = {"lat": (lat_min + lat_max) / 2, "lon": (lon_min + lon_max) / 2}
+    # latitude is stretched by the map projection (~1/cos(lat)).
+    lat_span = (lat_max - lat_min) / np.cos(np.radians(center["lat"]))
+    zoom = np.log2(360 / max(lon_max - lon_min, lat_span, 0.01)) - 0.3
+    return center, round(float(min(max(zoom, 3.0), 10.0)), 2)
+
+
+@data.loader("cpi_rates")
+def load_cpi_rates(key: str) -> pd.Series:
+    """
+    CPI for each year, from: https://www.scb.se/en/finding-statistics/statistics-by-subject-area/prices-and-consumption/consumer-price-index/consumer-price-index-cpi/pong/tables-and-graphs/consumer-price-index-cpi/cpi-fixed-index-numbers-1980100/
+    For 2021, the average from Jan to Aug was used (only data available at the time).
+    UPDATE - now using all of 2021 monnths are Jan to Sep average for 2022.
+    """
+    return pd.Series(data["bundle"].get_json("cpi_rates")).rename(index=int)
+
+
+@data.loader("county_kommun_mapping", "kommun_info_texts", "kommun_urls")
+def load_json_data(key: str):
+    """dicts made by get_kommun_county_info.py."""
+    return data["bundle"].get_json(key)
+
+
+# Lookups between kommuner, counties and relation ids, made once so the callbacks
+# don't have to search through county_kommun_mapping (county -> kommuner) each time.
+@data.loader("kommun_to_county")
+def build_kommun_to_county(key: str) -> dict:
+    return {kommun: county for county, kommuner in data["county_kommun_mapping"].items()
+            for kommun in kommuner}
+
+
+@data.loader("kommun_to_relation")
+def build_kommun_to_relation(key: str) -> dict:
+    return dict(dfs["rent_kommun"][["kommun", "Relation"]].drop_duplicates().values)
+
+
+# The rent dfs name counties as e.g. "Stockholm county", but county_kommun_mapping uses "Stockholm".
+@data.loader("county_long_names")
+def build_county_long_names(key: str) -> dict:
+    return {county: county + " county" for county in data["county_kommun_mapping"]}
+
+
+@data.loader("county_short_names")
+def build_county_short_names(key: str) -> dict:
+    return {long_name: county for county, long_name in data["county_long_names"].items()}
+
+
+################ Data prep for overview page ################
+@data.loader("kommun_bar_df")
+def build_kommun_bar_df(key: str) -> pd.DataFrame:
+    """Define Top 10 most expensive and least expensive kommuner to live in."""
+    kommun_bar_df = get_rows("rent_kommun", "Year", 2022)
+    # remove missing values
+    kommun_bar_df = kommun_bar_df[~(kommun_bar_df["Median Rent (SEK)"] <= 0)]
+    kommun_bar_df = kommun_bar_df.sort_values(
+        by=["Median Rent (SEK)"], ascending=True, ignore_index=True)
+    return kommun_bar_df.iloc[np.r_[0:10, -10:0]]  # filter for plotting.
+
+
+@data.loader("county_bar_df")
+def build_county_bar_df(key: str) -> pd.DataFrame:
+    """As there are 21 counties, show all on the bar graph but sort them first."""
+    county_bar_df = get_rows("rent_county", "Year", 2022)
+    # remove missing values
+    county_bar_df = county_bar_df[~(county_bar_df["Median Rent (SEK)"] <= 0)]
+    county_bar_df = county_bar_df.sort_values(
+        by=["Median Rent (SEK)"], ascending=True, ignore_index=True)
+    county_bar_df["county"] = county_bar_df["county"].map(
+        data["county_short_names"])
+    return county_bar_df
+
+
+def inflation_adjust(unadj_values, years, base_year: int = 2016) -> np.ndarray:
+    """
+    Adjust values for inflation, by default with 2016 set as the base year.
+    Works on whole columns at once, so the kommun and county dfs can be adjusted in one go.
+
+    Parameters
+    ----------
+    unadj_values : array-like of float
+        unadjusted values to convert.
+
+    years : array-like of int
+        Year of each value, to calculate inflation against.
+
+    base_year : int
+        Year the values are adjusted to.
+
+    Returns
+    -------
+    np.ndarray
+        values adjusted for inflation.
+    """
+    cpi_rates = data["cpi_rates"]
+    year_cpis = cpi_rates.reindex(np.asarray(years)).to_numpy()
+    if np.isnan(year_cpis).any() or base_year not in cpi_rates.index:
         raise ValueError(
-            "year parameter can only be within the range 2016-2022.")
-    return adj_value
+            f"years can only be within the range {cpi_rates.index.min()}-{cpi_rates.index.max()}, "
+            "add any missing years to assets/cpi_rates.json.")
+    return (np.asarray(unadj_values) * year_cpis) / cpi_rates[base_year]
+
+
+def complete_years_only(df: pd.DataFrame, kommun_or_county: str) -> pd.DataFrame:
+    """
+    Helper function to keep only the kommuner/counties with data for every year.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Rent df at the kommun or county level.
+
+    kommun_or_county : str
+        Defines if df is at the kommun or county level.
+
+    Returns
+    -------
+    pd.DataFrame
+        df without any missing data or kommuner/counties missing a year.
+    """
+    df = df[~(df["Median Rent (SEK)"] <= 0)]
+    numb_years = df.groupby(kommun_or_county)["Year"].transform("size")
+    return df[numb_years == dfs[f"rent_{kommun_or_county}"]["Year"].nunique()]
+
+
+# For a fairer comparison between the years, the rent increase graphs only use kommuner/counties
+# with complete data. Made once so the inflation toggle only has to pick which df to use.
+@dfs.loader("new_rent_kommun_complete", "new_rent_county_complete")
+def build_complete_df(df_name: str) -> pd.DataFrame:
+    return complete_years_only(dfs[df_name.replace("_complete", "")], df_name.split("_")[2])
+
+
+@dfs.loader("new_rent_kommun_adjusted", "new_rent_county_adjusted")
+def build_adjusted_df(df_name: str) -> pd.DataFrame:
+    df_complete = dfs[df_name.replace("_adjusted", "_complete")]
+    df_adjusted = df_complete.copy()
+    df_adjusted["Inflation Adjusted Median Rent (SEK)"] = inflation_adjust(
+        df_complete["Median Rent (SEK)"], df_complete["Year"]).round(1)
+    return df_adjusted
 
 
 ################ Data prep for specifics page ################
-# (unravels each sublist item into one long list)
-all_kommuner = [item for sublist in county_kommun_mapping.values()
-                for item in sublist]
-kommun_options = [{"label": x, "value": x} for x in all_kommuner]
+@data.loader("all_kommuner")
+def build_all_kommuner(key: str) -> list:
+    # (unravels each sublist item into one long list)
+    return [item for sublist in data["county_kommun_mapping"].values()
+            for item in sublist]
+
+
+def strip_accents(name: str) -> str:
+    """Helper function to remove any accents/diacritics from a name (e.g. "Malmö" -> "Malmo")."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def fold_name(name: str) -> str:
+    """
+    Helper function to make names comparable when searching, by making them lower case
+    and removing any accents/diacritics (e.g. "Malmö" -> "malmo", "Åre" -> "are").
+    """
+    return strip_accents(name.casefold())
+
+
+def build_search_index(names: list) -> list:
+    """
+    Fold every name once so searches only have to fold the search value.
+
+    Parameters
+    ----------
+    names : list
+        Names of the regions to search through, e.g. all_kommuner.
+
+    Returns
+    -------
+    list
+        (folded name, lower case name, original name) tuples.
+    """
+    return [(fold_name(name), name.casefold(), name) for name in names]
+
+
+def search_names(search_value: str, search_index: list) -> list:
+    """
+    Case insensitive search of a search index (see build_search_index).
+    Accents are ignored unless the search value has some, e.g. "malmo" finds "Malmö"
+    but "ö" only finds names with an "ö" in them.
+
+    Parameters
+    ----------
+    search_value : str
+        Text the user has typed so far.
+
+    search_index : list
+        (folded name, lower case name, original name) tuples made by build_search_index.
+
+    Returns
+    -------
+    list
+        Matching names ranked by: exact matches, names starting with the search value,
+        names with a word starting with the search value and then any other matches.
+        Names with the same rank stay in their original order.
+    """
+    search_value = search_value.strip().casefold()
+    ignore_accents = fold_name(search_value) == search_value
+    matches = []
+    for folded_name, lower_name, name in search_index:
+        compared_name = folded_name if ignore_accents else lower_name
+        position = compared_name.find(search_value)
+        if position == -1:
+            continue
+        if compared_name == search_value:
+            rank = 0
+        elif position == 0:
+            rank = 1
+        elif compared_name[position - 1] in " -":
+            rank = 2
+        else:
+            rank = 3
+        matches.append((rank, name))
+    matches.sort(key=lambda match: match[0])
+    return [name for _, name in matches]
 
 
-def get_key(val: str, my_dict: dict) -> str:
+def get_search_label(name: str, search_value: str) -> str:
     """
-    Helper function to return the "key" i.e. the county name for a given kommum.
-    Note that the "value" from the dict is a list of all kommuner in the county.
+    Helper function to label a search result in a dropdown. dcc.Dropdown filters the options
+    again in the browser (each word typed must be in the label, ignoring case but not accents),
+    so names only found by ignoring accents also show their name without accents,
+    e.g. "Malmö (Malmo)", otherwise the browser would hide them.
     """
-    for key, value in my_dict.items():
-        if val in value:
-            return key
-    return "key doesn't exist"
+    if all(word in name.casefold() for word in search_value.casefold().split()):
+        return name
+    return f"{name} ({strip_accents(name)})"
+
+
+@data.loader("kommun_search_index")
+def build_kommun_search_index(key: str) -> list:
+    return build_search_index(data["all_kommuner"])
+
+
+record_startup_time("data preparation")
 
 
 ####################################################################
@@ -492,7 +945,8 @@ rent_prices_vs_time = [
             dbc.Card([
                 dbc.CardBody([
                     graph_title_1,
-                    dcc.Graph(id="rent-choropleth-fig", figure={})
+                    dcc.Graph(id="rent-choropleth-fig", figure={}),
+                    dcc.Store(id="rent-vs-time-store"),
                 ]),
             ]),
         ], xs=12, sm=12, md=12, lg=6, xl=6, className="mb-2"),
@@ -622,6 +1076,8 @@ FAQs_page_layout = [
     ], width=12, className="mb-2"),
 ]
 
+record_startup_time("layout")
+
 
 ####################################################################
 ######################### Part 4 - Callbacks #######################
@@ -662,19 +1118,20 @@ def define_location(pathname):
 )
 def render_overview_page(kommun_or_county):
     """Callback to modify rent_prices_overview page format."""
+    import plotly.express as px  # slow to import, so only imported once a figure is made.
     if kommun_or_county == "kommun_view":
         card_body_title = card_body_title_kommun
         card_body_text = card_body_text_kommun
 
-        fig = px.bar(kommun_bar_df, x="Median Rent (SEK)", y="kommun", orientation="h",
+        fig = px.bar(data["kommun_bar_df"], x="Median Rent (SEK)", y="kommun", orientation="h",
                      color="Median Rent (SEK)", color_continuous_scale="ylgnbu")
         fig.add_hline(y=9.5, line_width=3,
                       line_dash="dash", line_color="black")
         fig.update_xaxes(range=[0, 2000])
 
         # now choropleth map
-        choro_df = dfs["rent_kommun"][(dfs["rent_kommun"]["Year"] == 2022)]
-        choro_map = px.choropleth_mapbox(choro_df, geojson=kommuner_map, locations="Relation",
+        choro_df = add_map_label(get_rows("rent_kommun", "Year", 2022))
+        choro_map = px.choropleth_mapbox(choro_df, geojson=get_map_geojson("kommuner"), locations="Relation",
                                          featureidkey="id", opacity=0.8, height=800,
                                          color="Median Rent (SEK)", color_continuous_scale="ylgnbu",
                                          range_color=[700, 1850],
@@ -691,12 +1148,12 @@ def render_overview_page(kommun_or_county):
         card_body_title = card_body_title_county
         card_body_text = card_body_text_county
 
-        fig = px.bar(county_bar_df, x="Median Rent (SEK)", y="county", orientation="h",
+        fig = px.bar(data["county_bar_df"], x="Median Rent (SEK)", y="county", orientation="h",
                      color="Median Rent (SEK)", color_continuous_scale="ylgnbu")
 
         # now choropleth map
-        choro_df = dfs["rent_county"][(dfs["rent_county"]["Year"] == 2022)]
-        choro_map = px.choropleth_mapbox(choro_df, geojson=counties_map, locations="Relation",
+        choro_df = add_map_label(get_rows("rent_county", "Year", 2022))
+        choro_map = px.choropleth_mapbox(choro_df, geojson=get_map_geojson("counties"), locations="Relation",
                                          featureidkey="id", opacity=0.8, height=800,
                                          color="Median Rent (SEK)", color_continuous_scale="ylgnbu",
                                          hover_data={"county": True, "Relation": False, "Year": False,
@@ -745,37 +1202,14 @@ def inflation_on_off_overview(inflation_selection):
     """Callback to update graphs with a correction for inflation or not."""
     years = [2016, 2017, 2018, 2019, 2020, 2021, 2022]
     # Take only those with data for each year.
-    df_new_rent_kommun = dfs["new_rent_kommun"][~(
-        dfs["new_rent_kommun"]["Median Rent (SEK)"] <= 0)]
-    complete_kommuner = df_new_rent_kommun["kommun"].value_counts().reset_index(
-        name="count").query("count == 7")["index"]  # all 7 years. Updated for 2022 data.
-    df_new_rent_kommun = df_new_rent_kommun[df_new_rent_kommun["kommun"].apply(
-        lambda x: x in list(complete_kommuner))]
-
-    df_new_rent_county = dfs["new_rent_county"][~(
-        dfs["new_rent_county"]["Median Rent (SEK)"] <= 0)]
-    complete_counties = df_new_rent_county["county"].value_counts().reset_index(
-        name="count").query("count == 7")["index"]  # all 7 years. Updated for 2022 data.
-    df_new_rent_county = df_new_rent_county[df_new_rent_county["county"].apply(
-        lambda x: x in list(complete_counties))]
+    df_new_rent_kommun = dfs["new_rent_kommun_complete"]
+    df_new_rent_county = dfs["new_rent_county_complete"]
 
     if inflation_selection == "inflation_on":
-        # first add new inflation adjusted column for plotting.
-        adjusted_cost_kommun = []
-        for price, year in zip(df_new_rent_kommun["Median Rent (SEK)"], df_new_rent_kommun["Year"]):
-            adjusted_cost_kommun.append(
-                round(inflation_adjust(price, year), 1))
-        df_new_rent_kommun_box = df_new_rent_kommun.copy()
-        df_new_rent_kommun_box["Inflation Adjusted Median Rent (SEK)"] = adjusted_cost_kommun
-
-        adjusted_cost_county = []
-        for price, year in zip(df_new_rent_county["Median Rent (SEK)"], df_new_rent_county["Year"]):
-            adjusted_cost_county.append(
-                round(inflation_adjust(price, year), 1))
-        df_new_rent_county_scatter = df_new_rent_county.copy()
-        df_new_rent_county_scatter["Inflation Adjusted Median Rent (SEK)"] = adjusted_cost_county
-
-        # Now plotting.
+        df_new_rent_kommun_box = dfs["new_rent_kommun_adjusted"]
+        df_new_rent_county_scatter = dfs["new_rent_county_adjusted"]
+
+        # Now plotting (customdata[4] is the "Inflation Adjusted Median Rent (SEK)" column).
         box_fig = go.Figure()
         for idx, year in enumerate(years):
             df = df_new_rent_kommun_box[(
@@ -784,7 +1218,7 @@ def inflation_on_off_overview(inflation_selection):
                                         box_visible=False, meanline_visible=True, line_color=violin_colors[idx], hoveron="points",
                                         ))
             box_fig.update_traces(
-                hovertemplate="<b>%{customdata[0]} </b><br><br>Median Cost: %{customdata[5]} SEK<extra></extra>")
+                hovertemplate="<b>%{customdata[0]} </b><br><br>Median Cost: %{customdata[4]} SEK<extra></extra>")
 
         scatter_fig = go.Figure()
         for county in (df_new_rent_county_scatter["county"].unique()):
@@ -796,7 +1230,7 @@ def inflation_on_off_overview(inflation_selection):
                                                  width=2, color='DarkSlateGrey')),
                                              ))
             scatter_fig.update_traces(
-                hovertemplate="<b>%{customdata[0]} </b><br><br>Median Cost: %{customdata[5]} SEK<extra></extra>")
+                hovertemplate="<b>%{customdata[0]} </b><br><br>Median Cost: %{customdata[4]} SEK<extra></extra>")
 
     else:
         # Straight to plotting.
@@ -841,18 +1275,31 @@ def inflation_on_off_overview(inflation_selection):
 
 ##################### rent_prices_vs_time callbacks ###########################
 
-@app.callback(
-    Output("rent-choropleth-fig", "figure"),
-    [Input("county-kommun-radio-vs-time-page", "value"),
-     Input("year-slider", "value")],
-)
-def choro_rent_vs_time(kommun_or_county, year):
-    """Rent prices choropleth callback."""
+# Only 2 views x 7 years exist, so each figure is built once per process and
+# then re-used. maxsize caps memory use, least recently used figures are evicted first.
+@lru_cache(maxsize=14)
+def build_rent_vs_time_map(kommun_or_county: str, year: int) -> go.Figure:
+    """
+    Build the choropleth map of median rent prices for a given view and year.
+
+    Parameters
+    ----------
+    kommun_or_county : str
+        Either "kommun_view" or "county_view".
+
+    year : int
+        Year of rent data to show on the map.
+
+    Returns
+    -------
+    go.Figure
+        Choropleth map of median rent prices.
+    """
+    import plotly.express as px  # slow to import, so only imported once a figure is made.
     if kommun_or_county == "kommun_view":
-        map_df = dfs["rent_kommun"][dfs["rent_kommun"]
-                                    ["Year"].apply(lambda x: x == year)]
+        map_df = add_map_label(get_rows("rent_kommun", "Year", year))
         fig = px.choropleth_mapbox(map_df,
-                                   geojson=kommuner_map, locations="Relation", opacity=0.8,
+                                   geojson=get_map_geojson("kommuner"), locations="Relation", opacity=0.8,
                                    color="Median Rent (SEK)", featureidkey="id", height=800,
                                    # "ylgnbu", "deep" # ["blue", "white", "red"]
                                    color_continuous_scale="ylgnbu", range_color=[700, 1850],
@@ -861,19 +1308,20 @@ def choro_rent_vs_time(kommun_or_county, year):
                                    )
 
     elif kommun_or_county == "county_view":
-        map_df = dfs["rent_county"][dfs["rent_county"]
-                                    ["Year"].apply(lambda x: x == year)]
+        map_df = add_map_label(get_rows("rent_county", "Year", year))
         fig = px.choropleth_mapbox(map_df,
-                                   geojson=counties_map, locations="Relation", opacity=0.8,
+                                   geojson=get_map_geojson("counties"), locations="Relation", opacity=0.8,
                                    color="Median Rent (SEK)", featureidkey="id", height=800,
                                    # "ylgnbu", "deep" # ["blue", "white", "red"]
                                    color_continuous_scale="ylgnbu", range_color=[850, 1350],
                                    hover_data={"county": True, "Relation": False, "Year": False,
                                                "Median Rent (SEK)": False, "Map Label": True},
                                    )
+    else:
+        raise ValueError(
+            "kommun_or_county can only be 'kommun_view' or 'county_view'.")
 
     # shared figure params below.
-    customdata = map_df
     fig.update_traces(
         hovertemplate="<b>%{customdata[0]} </b><br><br>%{customdata[4]}<extra></extra>")
     fig.update_layout(legend=dict(
@@ -887,6 +1335,60 @@ def choro_rent_vs_time(kommun_or_county, year):
     return fig
 
 
+@lru_cache(maxsize=2)
+def build_rent_vs_time_data(kommun_or_county: str) -> dict:
+    """
+    Collect everything the browser needs to draw the rent vs time map for every year.
+
+    Parameters
+    ----------
+    kommun_or_county : str
+        Either "kommun_view" or "county_view".
+
+    Returns
+    -------
+    dict
+        "figure" is the map for the most recent year and "years" holds the
+        "z" and "customdata" arrays of the map's trace for each year.
+    """
+    years = [2016, 2017, 2018, 2019, 2020, 2021, 2022]
+    rent_vs_time_data = {"figure": build_rent_vs_time_map(kommun_or_county, years[-1]),
+                         "years": {}}
+    for year in years:
+        trace = build_rent_vs_time_map(kommun_or_county, year).data[0]
+        rent_vs_time_data["years"][year] = {
+            "z": trace.z, "customdata": trace.customdata}
+    return rent_vs_time_data
+
+
+@app.callback(
+    Output("rent-vs-time-store", "data"),
+    Input("county-kommun-radio-vs-time-page", "value"),
+)
+def choro_rent_vs_time(kommun_or_county):
+    """Rent prices choropleth callback, sends the data for all years to the browser at once."""
+    return build_rent_vs_time_data(kommun_or_county)
+
+
+# Moving the year slider only swaps the values shown on the map, which is done in the browser
+# (so no trip to the server is needed).
+app.clientside_callback(
+    """
+    function(year, rent_vs_time_data) {
+        if (!rent_vs_time_data) {
+            return window.dash_clientside.no_update;
+        }
+        var figure = rent_vs_time_data.figure;
+        var trace = Object.assign({}, figure.data[0], rent_vs_time_data.years[year]);
+        return {data: [trace], layout: figure.layout};
+    }
+    """,
+    Output("rent-choropleth-fig", "figure"),
+    [Input("year-slider", "value"),
+     Input("rent-vs-time-store", "data")],
+)
+
+
 @app.callback(
     Output("rent-info-card", "children"),
     Input("rent-choropleth-fig", "clickData"),
@@ -895,15 +1397,14 @@ def choro_rent_vs_time(kommun_or_county, year):
 )
 def get_card(clickData, kommun_or_county):
     """Rent card callback"""
+    import plotly.express as px  # slow to import, so only imported once a figure is made.
     if clickData is not None:
         location_id = clickData["points"][0]["location"]  # gives relation id.
         location_name = clickData["points"][0]["customdata"][0]
         if kommun_or_county == "kommun_view":
-            bar_df = dfs["rent_kommun"][dfs["rent_kommun"]
-                                        ["Relation"].apply(lambda x: x == location_id)]
+            bar_df = get_rows("rent_kommun", "Relation", location_id)
         else:
-            bar_df = dfs["rent_county"][dfs["rent_county"]
-                                        ["Relation"].apply(lambda x: x == location_id)]
+            bar_df = get_rows("rent_county", "Relation", location_id)
 
         fig = px.bar(bar_df, x="Year", y="Median Rent (SEK)", color="Median Rent (SEK)",
                      color_continuous_scale="ylgnbu", range_color=[700, 1850])
@@ -936,76 +1437,87 @@ def get_card(clickData, kommun_or_county):
     [dash.dependencies.State("dropdown-kommun-select", "value")],
 )
 def update_multi_options(search_value, value):
-    """Callback for dropdown-kommun-select with case insensitive search"""
+    """Callback for dropdown-kommun-select with case and diacritic insensitive search"""
     if not search_value:
-        raise PreventUpdate
-    # Make sure that the set values are in the option list, else they will disappear
-    # from the shown select list, but still part of the `value`.
-    return [o for o in kommun_options if search_value.upper() in o["label"].upper() or o["value"] in (value or [])]
+        if not value:
+            raise PreventUpdate
+        # search finished, so the selected kommun is shown without any search label.
+        return [{"label": value, "value": value}]
+    matches = search_names(search_value, data["kommun_search_index"])
+    options = [{"label": get_search_label(x, search_value), "value": x} for x in matches]
+    # Make sure that the set value is in the option list, else it will disappear
+    # from the shown select list, but still be the `value`.
+    if value and value not in matches:
+        options.append({"label": value, "value": value})
+    return options
+
+
+# The specifics page only depends on the selected kommun and the data it is built from, so each
+# built page is kept and re-used, least recently used pages are dropped first. The data bundle's
+# content hash is part of the key, so a page built from older data is never re-used.
+@lru_cache(maxsize=64)
+def build_specifics_page(kommun: str, bundle_hash: str) -> tuple:
+    """
+    Build all 5 parts of the specifics page for a kommun.
 
+    Parameters
+    ----------
+    kommun : str
+        kommun selected by the user.
 
-@app.callback(
-    [Output("kommun-specific-info-text", "children"),
-     Output("kommun-specific-map", "children"),
-     Output("kommun-specific-to-county", "children"),
-     Output("kommun-specific-median-bar", "children"),
-     Output("kommun-specific-increase-bar", "children")
-     ],
-    Input("dropdown-kommun-select", "value"),
-)
-def update_specifics_page(kommun):
-    """Update specifics page based on user selected kommuner."""
+    bundle_hash : str
+        Content hash of the data bundle the page is built from (only used as part of the cache key).
 
+    Returns
+    -------
+    tuple
+        Contents of the info text, map, county comparison, median bar and increase bar cards.
+    """
+    import plotly.express as px  # slow to import, so only imported once a figure is made.
     # First filter based on user choice:
-    median_bar_df = dfs["rent_kommun"][dfs["rent_kommun"]
-                                       ["kommun"].apply(lambda x: x == kommun)]
-    increase_bar_df = dfs["new_rent_kommun"][dfs["new_rent_kommun"]["kommun"].apply(
-        lambda x: x == kommun)]
+    median_bar_df = get_rows("rent_kommun", "kommun", kommun)
+    increase_bar_df = get_rows("new_rent_kommun", "kommun", kommun)
 
     # Key Stats now:
     # gets the county name for the selected kommun.
-    county_name = get_key(kommun, county_kommun_mapping)
-    numb_of_kommuner = len(county_kommun_mapping[county_name])
-
-    df_2022 = dfs["rent_kommun"][dfs["rent_kommun"]
-                                 ["Year"].apply(lambda x: x == 2022)]
-    df_2021 = dfs["rent_kommun"][dfs["rent_kommun"]
-                                 ["Year"].apply(lambda x: x == 2021)]
-
-    # Current median rent rank
-    df_2022 = df_2022.sort_values(by=["Median Rent (SEK)"], ascending=False)
-    df_2022["Rank"] = df_2022["Median Rent (SEK)"].rank(
-        method="min", na_option="bottom", ascending=False)
-    kommun_rank = str(int(df_2022.loc[df_2022["kommun"] == kommun, "Rank"]))
-    kommun_rank_line = [html.Li(
-        f"{kommun} is ranked {kommun_rank} out of 289, for the most expensive municipality to rent an apartment in. (One municipality out of the 290 in Sweden does not have data available for this year).")]
-    # line now updated for new data with year 2022.
-
-    # Median rent increase from last year.
-    rent_2022 = df_2022[df_2022["kommun"].apply(
-        lambda x: x == kommun)]["Median Rent (SEK)"]
-    rent_2021 = df_2021[df_2021["kommun"].apply(
-        lambda x: x == kommun)]["Median Rent (SEK)"]
-    percent_increase = round((float(rent_2022)/float(rent_2021)*100) - 100, 1)
-    percent_increase_line = [html.Li(
-        f"{kommun} municipalities median rent increased by {percent_increase}% this year.")]
+    county_name = data["kommun_to_county"][kommun]
+    numb_of_kommuner = len(data["county_kommun_mapping"][county_name])
+
+    # Current median rent rank and increase from last year (made by prepare_rent_data.py).
+    kommun_stats = data["stats_kommun"].loc[(kommun, 2022)]
+    if pd.isna(kommun_stats["Rank"]):
+        kommun_rank_line = [html.P("")]
+    else:
+        kommun_rank = str(int(kommun_stats["Rank"]))
+        # only the kommuner with data for the year are ranked.
+        year_ranks = data["stats_kommun"].xs(2022, level="Year")["Rank"]
+        numb_ranked = int(year_ranks.notna().sum())
+        numb_unranked = len(year_ranks) - numb_ranked
+        unranked_text = ""
+        if numb_unranked:
+            unranked_text = (f" ({numb_unranked} of the {len(year_ranks)} municipalities in Sweden "
+                             f"{'does' if numb_unranked == 1 else 'do'} not have data available for this year).")
+        kommun_rank_line = [html.Li(
+            f"{kommun} is ranked {kommun_rank} out of {numb_ranked}, for the most expensive municipality to rent an apartment in.{unranked_text}")]
+
+    if pd.isna(kommun_stats["Change (%)"]):
+        percent_increase_line = [html.Li(
+            "Unfortunately no statistics can be calculated for this Municipality due to missing data.")]
+    else:
+        percent_increase = round(float(kommun_stats["Change (%)"]), 1)
+        percent_increase_line = [html.Li(
+            f"{kommun} municipalities median rent increased by {percent_increase}% this year.")]
 
     # Make a df for plotting all kommuner that belong to the same county (alongside the county average) rent price as scatter+line plot.
-    same_county_list = county_kommun_mapping[county_name]
+    same_county_list = data["county_kommun_mapping"][county_name]
     df_local_kommuner = dfs["rent_kommun"][dfs["rent_kommun"]
-                                           ["kommun"].apply(lambda x: x in same_county_list)]
-    df_county = dfs["rent_county"][dfs["rent_county"]
-                                   ["county"].apply(lambda x: x == (county_name + " county"))]
+                                           ["kommun"].isin(same_county_list)]
+    df_county = get_rows("rent_county", "county",
+                         data["county_long_names"][county_name])
     df_local_kommuner = df_local_kommuner.rename(columns={"kommun": "Place"})
     df_county = df_county.rename(columns={"county": "Place"})
     df_compare_county = pd.concat([df_county, df_local_kommuner])
 
-    # updated for 2022 - only kommun without data.
-    if kommun in ["Munkedal"]:
-        percent_increase_line = [html.Li(
-            "Unfortunately no statistics can be calculated for this Municipality due to missing data.")]
-        kommun_rank_line = [html.P("")]
-
     # Now make all figures needed.
     median_bar_fig = px.bar(median_bar_df, x="Median Rent (SEK)", y="Year",
                             color="Median Rent (SEK)", color_continuous_scale="deep", orientation="h")
@@ -1031,18 +1543,14 @@ def update_specifics_page(kommun):
     increase_bar_fig.update_traces(
         marker_line_color="black", marker_line_width=1.5, opacity=0.6)
 
-    # Map highlighing selected kommun.
-    def label_marked_kommun(row):
-        """Helper function for creating new a df column with a selected kommun labelled as 1,
-        all others labelled as 0. Useful for marking selected kommun's location on map."""
-        if row["kommun"] == kommun:
-            return 1
-        return 0
-
-    choro_df = (dfs["rent_kommun"]
-                [(dfs["rent_kommun"]["Year"] == 2022)]).copy()
-    choro_df["MarkedLabel"] = choro_df.apply(label_marked_kommun, axis=1)
-    choro_map = px.choropleth_mapbox(choro_df, geojson=kommuner_map,
+    # Map highlighing selected kommun (labelled as 1, all others labelled as 0).
+    # Zoomed in on its county, so only the county's kommuner are sent (at a higher resolution).
+    choro_df = get_rows("rent_kommun", "Year", 2022)
+    choro_df = add_map_label(choro_df[choro_df["kommun"].isin(same_county_list)])
+    choro_df["MarkedLabel"] = (
+        choro_df["Relation"] == data["kommun_to_relation"].get(kommun)).astype(int)
+    map_center, map_zoom = get_map_view("kommuner", get_county_relations(county_name))
+    choro_map = px.choropleth_mapbox(choro_df, geojson=get_map_geojson("kommuner", map_zoom, county_name),
                                      locations="Relation", featureidkey="id", opacity=0.8, height=475,
                                      color="MarkedLabel", color_continuous_scale=["white", "green"], range_color=[0, 1],
                                      hover_data={"kommun": True, "Relation": False, "Year": False, "Median Rent (SEK)": False,
@@ -1055,8 +1563,8 @@ def update_specifics_page(kommun):
         hovertemplate="<b>%{customdata[0]} </b><extra></extra>")
     choro_map.update_layout(
         legend=dict(yanchor="top", xanchor="left", x=0.01, y=0.80),
-        margin={"r": 0, "t": 40, "l": 0, "b": 0}, mapbox_center={"lat": 63.0, "lon": 20.00},
-        mapbox_style="white-bg", mapbox_zoom=3.3, coloraxis_showscale=False,
+        margin={"r": 0, "t": 40, "l": 0, "b": 0}, mapbox_center=map_center,
+        mapbox_style="white-bg", mapbox_zoom=map_zoom, coloraxis_showscale=False,
         title_font_color="green", title=dict(font_size=20)
     )
 
@@ -1065,7 +1573,7 @@ def update_specifics_page(kommun):
     for place in df_compare_county["Place"].unique():
         df = df_compare_county[(df_compare_county["Place"] == place)]
         # remove any missing values before plotting.
-        df = df[df["Median Rent (SEK)"].apply(lambda x: x > 0)]
+        df = df[df["Median Rent (SEK)"] > 0]
 
         # If else so I can emphasize the county average as bigger on the graph.
         if "county" in place:
@@ -1101,12 +1609,12 @@ def update_specifics_page(kommun):
                     f"{kommun} is one of {numb_of_kommuner} Municipalities that make up {county_name} County. ",
                     html.Br(), html.Br(),
                     html.B(html.A(
-                        f"Information Sverige's website describes {kommun} as follows:", href=kommun_urls[kommun], target="_blank")),
+                        f"Information Sverige's website describes {kommun} as follows:", href=data["kommun_urls"][kommun], target="_blank")),
                     html.Br(),
-                    "\"", kommun_info_texts[kommun], "\"",
+                    "\"", data["kommun_info_texts"][kommun], "\"",
                     html.Br(),
                     html.A(
-                        f"Feel free to check out their website for more information about {kommun} Municipality.", href=kommun_urls[kommun], target="_blank"),
+                        f"Feel free to check out their website for more information about {kommun} Municipality.", href=data["kommun_urls"][kommun], target="_blank"),
                     html.Br(), html.Br(),
                     html.H6(
                         [f"Key Statistics for {kommun} Municipality:"], className="card-title"),
@@ -1157,6 +1665,40 @@ def update_specifics_page(kommun):
     return info_text_content, kommun_map_content, compare_county_content, median_bar_content, increase_bar_content
 
 
+@app.callback(
+    [Output("kommun-specific-info-text", "children"),
+     Output("kommun-specific-map", "children"),
+     Output("kommun-specific-to-county", "children"),
+     Output("kommun-specific-median-bar", "children"),
+     Output("kommun-specific-increase-bar", "children")
+     ],
+    Input("dropdown-kommun-select", "value"),
+)
+def update_specifics_page(kommun):
+    """Update specifics page based on user selected kommuner."""
+    return build_specifics_page(kommun, data["bundle"].content_hash)
+
+
+##################### cache statistics ###########################
+
+@app.server.route("/cache-stats")
+def serve_cache_stats():
+    """Hit/miss counts for each of the caches, to check they are working."""
+    caches = {"rent_vs_time_map": build_rent_vs_time_map, "rent_vs_time_data": build_rent_vs_time_data,
+              "specifics_page": build_specifics_page, "map_file": build_map_file}
+    return flask.jsonify({name: cache.cache_info()._asdict() for name, cache in caches.items()})
+
+
+@app.server.route("/startup-stats")
+def serve_startup_stats():
+    """How long (in seconds) importing this file and loading each piece of data took,
+    to spot anything that slows down starting the web-app."""
+    return flask.jsonify({"import": startup_times["import"],
+                          "import total": round(sum(startup_times["import"].values()), 4),
+                          "lazy_loads": startup_times["lazy_loads"]})
+
+
+record_startup_time("callbacks")
 ######################### END OF Part 4 ######################
 if __name__ == "__main__":
     app.run_server()
@@ -0,0 +1,312 @@
+"""
+Rebuilds the files in the "assets" folder, only remaking those that are out of date.
+
+Each target (see get_targets) declares the files it is made from (its inputs, including the
+scripts that make it) and the files it makes (its outputs). A sha256 hash of every input and
+output is recorded in ".build_state.json" after a target is built, and a target is rebuilt when:
+* it has never been built, or any of its outputs are missing or were changed by hand.
+* any of its inputs have changed since it was last built.
+* it is named with "--force".
+
+A target whose inputs include another target's outputs is only checked once that target is done,
+so changes flow through (e.g. a new Statistics Sweden year remakes that rent table and then the
+stats tables, but not the maps or the scraped texts). Targets that don't depend on each other are
+built at the same time, each in its own process.
+
+Once the targets are built, the data bundle the web-app loads (see data_bundle.py) is rebuilt
+if any of the files in it have changed.
+
+The web scraping targets are made from websites, which can't be hashed. They are only rebuilt
+if their scripts change, their outputs are missing or they are forced. The first time this
+script runs (or after their list of outputs changes) the files already in the "assets" folder
+are taken as up to date.
+
+Terminology Note:
+The code in this script uses the Swedish words "kommun"/"kommuner"
+(translates to Municipality/Municiplaities in English) for varaiable naming.
+County/Counties (and not län/län) are used however.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from data_bundle import BUNDLE_PATH, BundleError, build_bundle, open_bundle
+from prepare_rent_data import RELATION_FILES, STAT_FILES
+from simplify_maps import RESOLUTION_LEVELS
+
+BUILD_STATE_PATH = ".build_state.json"
+
+
+def get_targets() -> dict:
+    """
+    Declare every target.
+
+    Returns
+    -------
+    dict
+        target name: {"function": "module:function" that builds it, "args": list of arguments,
+        "inputs": list of paths, "outputs": list of paths, "remote": True if it is made from websites}.
+    """
+    targets = {
+        "kommun_county_info": {
+            "function": "get_kommun_county_info:main", "args": [],
+            "inputs": ["get_kommun_county_info.py", "web_helpers.py"],
+            "outputs": ["assets/county_kommun_mapping.json", "assets/kommun_info_texts.json",
+                        "assets/kommun_urls.json"],
+            "remote": True,
+        },
+        "maps": {
+            "function": "get_geojson_data:main", "args": [],
+            "inputs": ["get_geojson_data.py", "web_helpers.py", "simplify_maps.py"],
+            # the full resolution kommuner map and its other levels are also made, but aren't kept in the repo.
+            # The counties levels are also made, but are remade from the full map by "counties_map_levels".
+            "outputs": [RELATION_FILES["kommun"], RELATION_FILES["county"], "assets/counties_map.json",
+                        "assets/kommuner_map_low_res.json", "assets/kommuner_map_low_res.topojson"],
+            "remote": True,
+        },
+        "counties_map_levels": {
+            "function": "simplify_maps:main", "args": [["assets/counties_map.json"]],
+            "inputs": ["assets/counties_map.json", "simplify_maps.py"],
+            "outputs": [f"assets/counties_map_{level}{extension}" for level in RESOLUTION_LEVELS
+                        for extension in (".json", ".topojson")],
+        },
+    }
+    for name, (stat_path, kommun_or_county, out_path) in STAT_FILES.items():
+        targets[name] = {
+            "function": "prepare_rent_data:ingest_stat_file",
+            "args": [stat_path, kommun_or_county, out_path],
+            "inputs": [stat_path, RELATION_FILES[kommun_or_county],
+                       "prepare_rent_data.py", "pxweb_data.py"],
+            "outputs": [out_path + ".csv"],
+        }
+    targets["rent_stats"] = {
+        "function": "prepare_rent_data:save_stats_tables", "args": [],
+        "inputs": [STAT_FILES["rent_kommun"][2] + ".csv", STAT_FILES["rent_county"][2] + ".csv",
+                   "assets/county_kommun_mapping.json", "prepare_rent_data.py"],
+        "outputs": ["assets/rent_stats_kommuner.csv", "assets/rent_stats_counties.csv"],
+    }
+    return targets
+
+
+def get_dependencies(targets: dict) -> dict:
+    """
+    Helper function to work out which targets each target needs built first
+    (those that make any of its inputs).
+    """
+    made_by = {path: name for name, target in targets.items()
+               for path in target["outputs"]}
+    return {name: sorted({made_by[path] for path in target["inputs"]
+                          if path in made_by and made_by[path] != name})
+            for name, target in targets.items()}
+
+
+def hash_file(path: str):
+    """sha256 of a file, None if it doesn't exist."""
+    try:
+        with open(path, "rb") as infile:
+            return hashlib.sha256(infile.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def load_build_state(path: str = BUILD_STATE_PATH) -> dict:
+    """Read what was recorded the last time each target was built."""
+    try:
+        with open(path, "r") as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_build_state(build_state: dict, path: str = BUILD_STATE_PATH) -> None:
+    """Save the build state (via a temporary file, so it is never half written)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as outfile:
+        json.dump(build_state, outfile, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def why_stale(target: dict, record: dict, input_hashes: dict, output_hashes: dict):
+    """
+    Decide if a target needs rebuilding.
+
+    Parameters
+    ----------
+    target : dict
+        The target, see get_targets.
+
+    record : dict
+        Hashes recorded the last time it was built ({"inputs": ..., "outputs": ...}), or None.
+
+    input_hashes, output_hashes : dict
+        path: hash of the target's inputs/outputs now.
+
+    Returns
+    -------
+    str
+        Reason it needs rebuilding, or None if it is up to date.
+    """
+    missing = [path for path, file_hash in output_hashes.items() if file_hash is None]
+    if missing:
+        return f"{missing[0]} is missing"
+    if record is None or set(record["outputs"]) != set(output_hashes):
+        # never built, or built before its list of outputs changed.
+        return None if target.get("remote") else "never built"
+    for path, file_hash in input_hashes.items():
+        if record["inputs"].get(path) != file_hash:
+            return f"{path} has changed"
+    for path, file_hash in output_hashes.items():
+        if record["outputs"].get(path) != file_hash:
+            return f"{path} was changed by hand"
+    return None
+
+
+def run_target(function: str, args: list) -> None:
+    """Build a target (runs in a worker process)."""
+    module_name, function_name = function.split(":")
+    getattr(importlib.import_module(module_name), function_name)(*args)
+
+
+def build(names: list = None, force: list = (), max_workers: int = None,
+          dry_run: bool = False, build_state_path: str = BUILD_STATE_PATH) -> list:
+    """
+    Rebuild every out of date target (or only those in names, and what they depend on).
+
+    Parameters
+    ----------
+    names : list
+        Targets to build, all of them if None.
+
+    force : list
+        Targets to rebuild even if they are up to date.
+
+    max_workers : int
+        Number of targets to build at once, defaults to the number of CPUs.
+
+    dry_run : bool
+        If True, only print what would be rebuilt (and why). Targets that depend on
+        one that would be rebuilt are listed too, though they may turn out up to date
+        (if the rebuilt target's outputs don't change).
+
+    build_state_path : str
+        Where the hashes of each target's last build are saved.
+
+    Returns
+    -------
+    list
+        Names of the targets that were (or would be) rebuilt.
+    """
+    targets = get_targets()
+    dependencies = get_dependencies(targets)
+    if names is None:
+        names = list(targets)
+    unknown = [name for name in list(names) + list(force) if name not in targets]
+    if unknown:
+        raise ValueError(f"Unknown target(s): {unknown}, choose from {list(targets)}.")
+
+    # add everything the chosen targets depend on.
+    wanted = set()
+    to_visit = list(names)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in wanted:
+            wanted.add(name)
+            to_visit.extend(dependencies[name])
+
+    build_state = load_build_state(build_state_path)
+    done = set()
+    rebuilt = []
+    running = {}  # future: (name, input hashes)
+
+    def record_build(name, input_hashes):
+        build_state[name] = {"inputs": input_hashes,
+                             "outputs": {path: hash_file(path) for path in targets[name]["outputs"]}}
+        save_build_state(build_state, build_state_path)
+
+    def check_ready_targets(executor) -> bool:
+        """Start every target whose dependencies are done, True if any were found up to date."""
+        progress = False
+        running_names = [name for name, _ in running.values()]
+        for name, target in targets.items():
+            if (name not in wanted or name in done or name in running_names
+                    or any(dependency not in done for dependency in dependencies[name])):
+                continue
+            input_hashes = {path: hash_file(path) for path in target["inputs"]}
+            missing = [path for path, file_hash in input_hashes.items() if file_hash is None]
+            if missing:
+                raise FileNotFoundError(f"{name}: input {missing[0]} doesn't exist.")
+            reason = "forced" if name in force else why_stale(
+                target, build_state.get(name), input_hashes,
+                {path: hash_file(path) for path in target["outputs"]})
+            if reason is None and dry_run:
+                reason = next((f"{dependency} would be rebuilt" for dependency in dependencies[name]
+                               if dependency in rebuilt), None)
+            if reason is None:
+                record = build_state.get(name)
+                if record is None or set(record["outputs"]) != set(target["outputs"]):
+                    record_build(name, input_hashes)  # web scraping target, taken as up to date.
+                print(f"{name}: up to date.")
+            elif dry_run:
+                print(f"{name}: would rebuild ({reason}).")
+                rebuilt.append(name)
+            else:
+                print(f"{name}: rebuilding ({reason})...")
+                future = executor.submit(run_target, target["function"], target["args"])
+                running[future] = (name, input_hashes)
+                continue
+            done.add(name)
+            progress = True
+        return progress
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while check_ready_targets(executor):
+                pass  # a target found up to date can make others ready.
+            if not running:
+                break
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                name, input_hashes = running.pop(future)
+                future.result()  # raises the target's error, if it failed.
+                missing = [path for path in targets[name]["outputs"] if not os.path.exists(path)]
+                if missing:
+                    raise FileNotFoundError(f"{name}: didn't make {missing[0]}.")
+                record_build(name, input_hashes)
+                print(f"{name}: done.")
+                rebuilt.append(name)
+                done.add(name)
+    if wanted - done:
+        raise ValueError(f"Targets depend on each other in a loop: {sorted(wanted - done)}.")
+    return rebuilt
+
+
+def main(names: list = None, force: list = (), max_workers: int = None, dry_run: bool = False):
+    """Rebuild the out of date files in the "assets" folder (only those of the targets named, if any),
+    and then the data bundle if it is out of date."""
+    rebuilt = build(names, force, max_workers, dry_run)
+    print(f"{'Would rebuild' if dry_run else 'Rebuilt'} {len(rebuilt)} target(s).")
+    if dry_run:
+        return
+    try:
+        open_bundle()
+        print(f"{BUNDLE_PATH}: up to date.")
+    except BundleError:
+        print(f"{BUNDLE_PATH}: rebuilding...")
+        build_bundle()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("targets", nargs="*",
+                        help=f"Targets to build (default: all of them), from: {', '.join(get_targets())}.")
+    parser.add_argument("--force", nargs="+", default=[], metavar="TARGET",
+                        help="Rebuild these targets even if they are up to date "
+                             "(e.g. to re-scrape the websites).")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of targets to build at once (default: the number of CPUs).")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Only print what would be rebuilt, and why.")
+    args = parser.parse_args()
+    main(args.targets or None, args.force, args.workers, args.dry_run)
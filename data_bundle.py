@@ -0,0 +1,310 @@
+"""
+Packs all the data the web-app reads at startup (rent tables, stats tables, maps and
+json dicts from the "assets" folder) into one binary file, "build/data_bundle.bin".
+The bundle is kept out of "assets", as Dash serves everything in that folder publicly.
+
+The web-app memory-maps the bundle read-only instead of reading and parsing each file.
+The tables are stored column by column as raw NumPy arrays, and get_dataframe wraps those
+arrays without copying them, so with several web-app processes (workers) on one machine the
+operating system keeps one shared copy of the rent tables in memory instead of one per process.
+The json entries (the dicts and the TopoJSON maps) can't be shared this way, as each worker has
+to parse them into its own Python objects, only their raw bytes are shared.
+
+The bundle is built by running this script (or build_assets.py), which must be done before
+starting the web-app, as the web-app never writes to the "build" folder. It records the size
+and modification time of each file it was built from, and open_bundle refuses to open a bundle
+that is missing or out of date (checking this doesn't need the files to be read).
+
+Bundle layout:
+8 byte magic number, 4 byte format version, 4 byte header length, the header (json)
+and then each entry's data, every entry starting on a 64 byte boundary.
+
+Terminology Note:
+The code in this script uses the Swedish words "kommun"/"kommuner"
+(translates to Municipality/Municiplaities in English) for varaiable naming.
+County/Counties (and not län/län) are used however.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import numpy as np
+import pandas as pd
+from simplify_maps import RESOLUTION_LEVELS
+
+BUNDLE_PATH = "build/data_bundle.bin"
+BUNDLE_MAGIC = b"SERENTDB"
+BUNDLE_VERSION = 3  # increase if the layout changes, older bundles then need rebuilding.
+ALIGNMENT = 64
+
+
+def get_bundle_sources() -> dict:
+    """
+    List the files that go in the bundle.
+
+    Returns
+    -------
+    dict
+        entry name: (kind, path). kind is one of "rent_table" (a "_cleaned.csv" file made by
+        prepare_rent_data.py, given without the file extension), "csv" or "json".
+        Maps are included at each resolution level that exists.
+    """
+    sources = {
+        "rent_kommun": ("rent_table", "assets/median_rent_kommuner_cleaned"),
+        "rent_county": ("rent_table", "assets/median_rent_counties_cleaned"),
+        "new_rent_kommun": ("rent_table", "assets/median_new_rent_kommuner_cleaned"),
+        "new_rent_county": ("rent_table", "assets/median_new_rent_counties_cleaned"),
+        "stats_kommun": ("csv", "assets/rent_stats_kommuner.csv"),
+        "stats_county": ("csv", "assets/rent_stats_counties.csv"),
+        "cpi_rates": ("json", "assets/cpi_rates.json"),
+        "county_kommun_mapping": ("json", "assets/county_kommun_mapping.json"),
+        "kommun_info_texts": ("json", "assets/kommun_info_texts.json"),
+        "kommun_urls": ("json", "assets/kommun_urls.json"),
+    }
+    for map_name in ("kommuner", "counties"):
+        for level in RESOLUTION_LEVELS:
+            path = f"assets/{map_name}_map_{level}.topojson"
+            if os.path.exists(path):
+                sources[f"{map_name}_map_{level}"] = ("json", path)
+    return sources
+
+
+def get_source_files(kind: str, path: str) -> list:
+    """Helper function to list the file(s) an entry is read from."""
+    if kind == "rent_table":
+        return [path + ".csv"]
+    return [path]
+
+
+def stat_sources(sources: dict) -> dict:
+    """[size, modification time (ns)] of every file in the bundle, to tell if the bundle is out of date."""
+    stats = {}
+    for kind, path in sources.values():
+        for file_path in get_source_files(kind, path):
+            file_stat = os.stat(file_path)
+            stats[file_path] = [file_stat.st_size, file_stat.st_mtime_ns]
+    return stats
+
+
+class BundleError(Exception):
+    """The bundle is missing or out of date, and needs (re)building."""
+
+
+def load_rent_table(path: str) -> pd.DataFrame:
+    """
+    Load a rent table saved by prepare_rent_data.py (the "_cleaned.csv" file).
+
+    Parameters
+    ----------
+    path : str
+        Path to the table, without the file extension.
+
+    Returns
+    -------
+    pd.DataFrame
+        Same columns as the csv file, except "Map Label" (the web-app makes it when it is needed).
+        The kommun/county names are a categorical column (categories in the order of the file).
+    """
+    df = pd.read_csv(path + ".csv").drop(columns="Map Label")
+    region_column = df.columns[0]
+    df[region_column] = pd.Categorical(df[region_column], categories=df[region_column].unique())
+    return df
+
+
+def pack_dataframe(df: pd.DataFrame) -> tuple:
+    """
+    Helper function to split a dataframe into arrays for the bundle.
+    Text columns are stored as integer codes, with the list of distinct values in the header.
+
+    Returns
+    -------
+    tuple
+        (list of column info dicts for the header, list of arrays).
+    """
+    columns = []
+    arrays = []
+    for name, column in df.items():
+        info = {"name": name}
+        if column.dtype == object:
+            codes, categories = pd.factorize(column)  # missing values get code -1
+            column = pd.Series(pd.Categorical.from_codes(codes, categories))
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            info["categories"] = list(column.cat.categories)
+            # in the smallest integer type that fits, as pandas uses, so the codes aren't copied when read.
+            values = column.cat.codes.to_numpy()
+        else:
+            values = column.to_numpy()
+        info["dtype"] = values.dtype.str
+        columns.append(info)
+        arrays.append(np.ascontiguousarray(values))
+    return columns, arrays
+
+
+def build_bundle(bundle_path: str = BUNDLE_PATH, sources: dict = None) -> None:
+    """
+    Build the bundle and save it (via a temporary file, so a bundle is never half written and
+    a web-app worker opening it at the same time sees either the old or the new bundle).
+
+    Parameters
+    ----------
+    bundle_path : str
+        Where to save the bundle.
+
+    sources : dict
+        Files to pack, defaults to get_bundle_sources().
+    """
+    if sources is None:
+        sources = get_bundle_sources()
+    # stat the files before reading them, so a file changed while building makes the bundle out of date.
+    source_stats = stat_sources(sources)
+
+    entries = {}
+    blobs = []  # data of each entry, in the same order as entries.
+    for name, (kind, path) in sources.items():
+        if kind == "json":
+            with open(path, "rb") as infile:
+                blobs.append([infile.read()])
+            entries[name] = {"kind": "json"}
+        else:
+            df = load_rent_table(
+                path) if kind == "rent_table" else pd.read_csv(path)
+            columns, arrays = pack_dataframe(df)
+            blobs.append([array.tobytes() for array in arrays])
+            entries[name] = {"kind": "dataframe",
+                             "length": len(df), "columns": columns}
+
+    # work out where each piece of data goes. Offsets are from the (aligned) end of
+    # the header, as the header's size depends on them.
+    offset = 0
+    for entry, pieces in zip(entries.values(), blobs):
+        sections = []
+        for piece in pieces:
+            sections.append([offset, len(piece)])
+            offset += -(-len(piece) // ALIGNMENT) * ALIGNMENT
+        entry["sections"] = sections
+    # hash of everything in the bundle, so caches of anything made from it can tell bundles apart.
+    content_hash = hashlib.sha256(json.dumps(entries, sort_keys=True).encode("utf-8"))
+    for pieces in blobs:
+        for piece in pieces:
+            content_hash.update(piece)
+    header = json.dumps({"sources": source_stats, "content_hash": content_hash.hexdigest(), "entries": entries},
+                        ensure_ascii=False).encode("utf-8")
+    data_start = -(-(16 + len(header)) // ALIGNMENT) * ALIGNMENT
+
+    os.makedirs(os.path.dirname(bundle_path) or ".", exist_ok=True)
+    tmp_path = f"{bundle_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(BUNDLE_MAGIC + struct.pack("<II",
+                      BUNDLE_VERSION, len(header)) + header)
+        for entry, pieces in zip(entries.values(), blobs):
+            for (piece_offset, _), piece in zip(entry["sections"], pieces):
+                outfile.seek(data_start + piece_offset)
+                outfile.write(piece)
+        outfile.truncate(data_start + offset)
+    os.replace(tmp_path, bundle_path)
+
+
+class DataBundle:
+    """
+    Read-only, memory-mapped view of a bundle made by build_bundle.
+
+    Parameters
+    ----------
+    bundle_path : str
+        Path to the bundle.
+    """
+
+    def __init__(self, bundle_path: str = BUNDLE_PATH):
+        with open(bundle_path, "rb") as infile:
+            self._mmap = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mmap) < 16 or self._mmap[:8] != BUNDLE_MAGIC:
+            raise ValueError(f"{bundle_path} is not a data bundle.")
+        version, header_length = struct.unpack_from("<II", self._mmap, 8)
+        if version != BUNDLE_VERSION:
+            raise ValueError(f"{bundle_path} is not a version {BUNDLE_VERSION} data bundle.")
+        header = json.loads(self._mmap[16:16 + header_length])
+        self.sources = header["sources"]
+        self.content_hash = header["content_hash"]
+        self.entries = header["entries"]
+        self._data_start = -(-(16 + header_length) // ALIGNMENT) * ALIGNMENT
+
+    def _section(self, name: str, number: int = 0) -> memoryview:
+        offset, length = self.entries[name]["sections"][number]
+        start = self._data_start + offset
+        return memoryview(self._mmap)[start:start + length]
+
+    def get_json(self, name: str):
+        """Parse a json entry (e.g. "county_kommun_mapping")."""
+        return json.loads(bytes(self._section(name)))
+
+    def get_array(self, name: str, column: str) -> np.ndarray:
+        """Read-only array of one column of a dataframe entry, straight from the memory-map."""
+        columns = self.entries[name]["columns"]
+        number = [info["name"] for info in columns].index(column)
+        return np.frombuffer(self._section(name, number), dtype=columns[number]["dtype"])
+
+    def get_dataframe(self, name: str) -> pd.DataFrame:
+        """
+        Rebuild a dataframe entry (e.g. "rent_kommun"), text columns are categorical.
+        The columns are read-only views of the memory-map (not copies), so the dataframe
+        must not be changed in place.
+        """
+        data = {}
+        for info in self.entries[name]["columns"]:
+            values = self.get_array(name, info["name"])
+            if "categories" in info:
+                data[info["name"]] = pd.Categorical.from_codes(
+                    values, info["categories"])
+            else:
+                data[info["name"]] = values
+        return pd.DataFrame(data, copy=False)
+
+
+def open_bundle(bundle_path: str = BUNDLE_PATH, sources: dict = None) -> DataBundle:
+    """
+    Open the bundle, after checking it was built from the current files.
+
+    Parameters
+    ----------
+    bundle_path : str
+        Path to the bundle.
+
+    sources : dict
+        Files it should be built from, defaults to get_bundle_sources().
+
+    Raises
+    ------
+    BundleError
+        If the bundle is missing, from an older version, or any of the files it is built from
+        have been added, removed or changed since it was built.
+    """
+    if sources is None:
+        sources = get_bundle_sources()
+    fix = "run \"python data_bundle.py\" (or \"python build_assets.py\") to build it."
+    try:
+        bundle = DataBundle(bundle_path)
+    except (OSError, ValueError) as error:  # missing, or not a bundle of this version.
+        raise BundleError(f"Can't open the data bundle ({error}), {fix}") from error
+    if set(bundle.entries) != set(sources):
+        raise BundleError(f"{bundle_path} doesn't have the files the web-app needs, {fix}")
+    try:
+        source_stats = stat_sources(sources)
+    except OSError as error:
+        raise BundleError(f"Can't check {bundle_path} is up to date ({error}).") from error
+    changed = [path for path, stat in source_stats.items() if bundle.sources.get(path) != stat]
+    if changed:
+        raise BundleError(f"{bundle_path} is out of date ({', '.join(changed)} changed), {fix}")
+    return bundle
+
+
+def main():
+    """Build the data bundle from the files in the "assets" folder."""
+    build_bundle()
+    bundle = DataBundle()
+    print(f"Saved {BUNDLE_PATH} ({os.path.getsize(BUNDLE_PATH)} bytes, "
+          f"{len(bundle.entries)} entries).")
+
+
+if __name__ == "__main__":
+    main()
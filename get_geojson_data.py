@@ -8,21 +8,70 @@ The code in this script uses the Swedish words "kommun"/"kommuner"
 County/Counties (and not län/län) are used however.
 """
 from typing import Tuple
+import argparse
 import json
-from urllib.request import urlopen
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from simplify_maps import write_resolution_levels
+from web_helpers import RateLimiter, ResponseCache, fetch_url, read_html_tables
 
+# {relation} is replaced with the relation number of each county/kommun.
+OSM_POLYGONS_URL = "http://polygons.openstreetmap.fr/get_geojson.py?id={relation}&params=0"
 
-def get_geojson_map(relation_numbers: list) -> Tuple[dict, list]:
+
+def get_geojson_feature(relation: int, url_pattern: str, rate_limiter: RateLimiter,
+                        cache: ResponseCache = None):
+    """
+    Helper function to download the geojson data for one county/kommun
+    and reformat it as a geojson "Feature".
+    Returns None if the data could not be downloaded or read.
+    """
+    def read_feature(body):
+        coordset = json.loads(body)
+        # Reformat coordsets before returning.
+        coordset["type"] = "Feature"
+        coordset["geometries"] = coordset["geometries"][0]
+        coordset["geometry"] = coordset.pop("geometries")
+        coordset["id"] = relation
+        return coordset
+
+    try:
+        # only cached if it can be read.
+        return fetch_url(url_pattern.format(relation=relation), rate_limiter=rate_limiter,
+                         cache=cache, parse=read_feature)
+
+    # ValueError includes JSONDecodeError, LookupError/TypeError are json without the expected layout
+    # and OSError failed downloads.
+    except (ValueError, LookupError, TypeError, OSError):
+        return None
+
+
+def get_geojson_map(relation_numbers: list, url_pattern: str = OSM_POLYGONS_URL,
+                    max_workers: int = 8, requests_per_second: float = 8,
+                    cache: ResponseCache = None) -> Tuple[dict, list]:
     """
     Extract geojson data for both county and kommuner.
     Store any counties or kommuner that failed to be extracted.
+    Several relations are downloaded at once, with the number of requests
+    made to each host per second limited so the server isn't overloaded.
 
     Parameters
     ----------
     relation_numbers : list
         list of unique i.d.s for each county/kommun.
 
+    url_pattern : str
+        url to download each relation from, "{relation}" is replaced with the relation number.
+        Can be changed to point to a local server for testing.
+
+    max_workers : int
+        Maximum number of relations downloaded at the same time.
+
+    requests_per_second : float
+        Maximum number of requests made to each host per second.
+
+    cache : ResponseCache
+        Local cache of downloaded relations, so unchanged relations aren't downloaded again.
+
     Returns
     -------
     complete_map : dict
@@ -31,27 +80,21 @@ def get_geojson_map(relation_numbers: list) -> Tuple[dict, list]:
     fail_list : list
         Counties or kommuner that failed to be extracted.
     """
-    url_geojson_pre = "http://polygons.openstreetmap.fr/get_geojson.py?id="
-    url_geojson_post = "&params=0"
+    rate_limiter = RateLimiter(requests_per_second, burst=max_workers)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        coordsets = list(executor.map(
+            lambda relation: get_geojson_feature(
+                relation, url_pattern, rate_limiter, cache),
+            relation_numbers))
+
     kommuner_features = []
-    numb_fails = 0
     fail_list = []
-    for relation in relation_numbers:
-        relation_url = url_geojson_pre + str(relation) + url_geojson_post
-        with urlopen(relation_url) as response:
-            try:
-                coordset = json.load(response)
-                # Reformat coordsets before appending.
-                coordset["type"] = "Feature"
-                coordset["geometries"] = coordset["geometries"][0]
-                coordset["geometry"] = coordset.pop("geometries")
-                coordset["id"] = relation
-                kommuner_features.append(coordset)
-
-            except ValueError:  # includes simplejson.decoder.JSONDecodeError
-                numb_fails += 1
-                fail_list.append(relation)
-    print(f"Getting JSON Data failed {numb_fails} times.")
+    for relation, coordset in zip(relation_numbers, coordsets):
+        if coordset is None:
+            fail_list.append(relation)
+        else:
+            kommuner_features.append(coordset)
+    print(f"Getting JSON Data failed {len(fail_list)} times.")
 
     # Now construct the complete geoJson file.
     complete_map = {}
@@ -61,18 +104,21 @@ def get_geojson_map(relation_numbers: list) -> Tuple[dict, list]:
     return complete_map, fail_list
 
 
-def main():
-    """Webscrape maps, build complete maps and save"""
+def main(offline: bool = False):
+    """Webscrape maps, build complete maps and save.
+    Downloads are cached in ".http_cache", if offline only the cache is used."""
+    cache = ResponseCache(offline=offline)
+
     # Grab Kommun and county relation numbers from wiki.
     # No comments on either page so happy to drop them.
     url_kommuner = "https://wiki.openstreetmap.org/wiki/Sweden/Kommuner"
-    df_kommuner = (pd.read_html(url_kommuner))[0]  # I want 1st table on page
+    df_kommuner = fetch_url(url_kommuner, cache=cache, parse=read_html_tables)[0]  # I want 1st table on page
     df_kommuner = df_kommuner.drop(["KommentarComment"], axis=1)
     df_kommuner = df_kommuner.rename(columns={"KommunMunicipality": "kommun"})
     kommuner_relation_nums = df_kommuner["Relation"]
 
     url_counties = "https://wiki.openstreetmap.org/wiki/Sweden/L%C3%A4n"
-    df_counties = (pd.read_html(url_counties))[1]  # I want 2nd table on page
+    df_counties = fetch_url(url_counties, cache=cache, parse=read_html_tables)[1]  # I want 2nd table on page
     drop_list = ["SCB", "NUTS-1", "NUTS-2", "NUTS-3",
                  "FIPS", "ISO-3166-2", "KommentarComment"]
     df_counties = df_counties.drop(drop_list, axis=1)
@@ -85,8 +131,10 @@ def main():
 
     counties_relations_nums = df_counties["Relation"]
 
-    counties_map, counties_fail_list = get_geojson_map(counties_relations_nums)
-    kommuner_map, kommuner_fail_list = get_geojson_map(kommuner_relation_nums)
+    counties_map, counties_fail_list = get_geojson_map(
+        counties_relations_nums, cache=cache)
+    kommuner_map, kommuner_fail_list = get_geojson_map(
+        kommuner_relation_nums, cache=cache)
 
     # Remove any that are in the fail_list (thankfully none).
     df_kommuner = df_kommuner[~df_kommuner.Relation.isin(kommuner_fail_list)]
@@ -100,6 +148,13 @@ def main():
     with open("assets/counties_map.json", "w") as outfile:
         json.dump(counties_map, outfile)
 
+    # Lower resolution versions of the maps, which are used by the web-app.
+    write_resolution_levels("assets/kommuner_map.json")
+    write_resolution_levels("assets/counties_map.json")
+
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--offline", action="store_true",
+                        help="Only use previously downloaded pages (from .http_cache).")
+    main(offline=parser.parse_args().offline)
@@ -11,26 +11,140 @@ The code in this script uses the Swedish words "kommun"/"kommuner"
 (translates to Municipality/Municiplaities in English) for varaiable naming.
 County/Counties (and not län/län) are used however.
 """
+import argparse
 import json
-import random
-import time
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Tuple
-import pandas as pd
 from bs4 import BeautifulSoup
 import requests
+from requests.adapters import HTTPAdapter
+from web_helpers import RateLimiter, ResponseCache, fetch_url, fetch_with_retries, read_html_tables
+
+INFO_SVERIGE_URL = "https://www.informationsverige.se/en/jag-har-fatt-uppehallstillstand/boende/lan-och-kommuner-i-sverige/"
+
+
+# helper function for step 2.
+def get_kommun_url(county: str, kommun: str, url_pre: str = INFO_SVERIGE_URL) -> str:
+    """
+    Build the web address of a kommun's page on https://www.informationsverige.se/en/.
+
+    Parameters
+    ----------
+    county : str
+        County the kommun belongs to.
+
+    kommun : str
+        kommun name.
+
+    url_pre : str
+        Start of the web address, shared by all kommuner.
+
+    Returns
+    -------
+    str
+        web link to the kommun's info page.
+    """
+    # First need to fix the names to match webadress formatting.
+    if county == "Västra Götaland":
+        url_county = "vastra-gotalands"
+    elif county not in ["Blekinge", "Kalmar", "Skåne", "Uppsala", "Örebro"]:
+        url_county = county.lower()
+        url_county += "s"
+    else:
+        url_county = county.lower()
+
+    for pattern in (("ä", "a"), ("å", "a"), ("ö", "o")):
+        url_county = url_county.replace(*pattern)
+
+    # There are 7 special names that don't follow the general patterns below.
+    # They have to be taken care of manually.
+    awkward_kommuners = {"Bollebygd": "bollebyggd", "Gothenburg": "goteborg", "Hällefors": "hellefors",
+                         "Lilla Edet": "lillaedet", "Upplands Väsby": "upplandsvasby",
+                         "Ängelholm": "engelholm", "Östra Göinge": "ostragoinge"}
+    if kommun in awkward_kommuners:
+        url_kommun = awkward_kommuners[kommun]
+    else:  # the rest can be treated as following a general pattern.
+        url_kommun = kommun.lower()
+        for pattern in (("ä", "a"), ("å", "a"), ("ö", "o")):
+            url_kommun = url_kommun.replace(*pattern)
+
+    return url_pre + url_county + "-lan/" + url_kommun
 
 
 # helper function for step 2.
-def get_kommun_info_paragraph(county_kommun_mapping: dict) -> Tuple[dict, dict, list]:
+def get_info_text(url: str, session: requests.Session, rate_limiter: RateLimiter,
+                  cache: ResponseCache = None) -> str:
+    """
+    Download a kommun's info page and extract its introductory paragraph.
+
+    Parameters
+    ----------
+    url : str
+        web link to the kommun's info page.
+
+    session : requests.Session
+        Shared session, so connections to the site are re-used.
+
+    rate_limiter : RateLimiter
+        Shared rate limiter, to not overload the site.
+
+    cache : ResponseCache
+        Local cache of downloaded pages, so unchanged pages aren't downloaded again.
+
+    Returns
+    -------
+    str
+        The paragraph, or None if it could not be found.
+    """
+    def send(url, request_headers):
+        rate_limiter.wait(url)
+        response = session.get(url, headers=request_headers, timeout=60)
+        response.raise_for_status()  # so server errors are retried (by fetch_with_retries).
+        return response.status_code, response.content, response.headers
+
+    def read_paragraph(body):
+        soup = BeautifulSoup(body, "lxml")
+        return (soup.find("p", class_="ingress")).string
+
+    try:
+        # only cached if the paragraph is found.
+        return fetch_with_retries(url, send, cache, parse=read_paragraph)
+
+    # AttributeError if incorrect web address - now 0 fails :)
+    # OSError if the download failed, or if offline and the page isn't in the cache.
+    except (AttributeError, OSError, requests.RequestException):
+        return None
+
+
+# helper function for step 2.
+def get_kommun_info_paragraph(county_kommun_mapping: dict, url_pre: str = INFO_SVERIGE_URL,
+                              max_workers: int = 4, requests_per_second: float = 2,
+                              cache: ResponseCache = None) -> Tuple[dict, dict, list]:
     """
     Given a dict of county and kommun names, extract a paragraph of information about
     each one from: https://www.informationsverige.se/en/.
+    Several pages are downloaded (and parsed) at once, with the number of requests
+    per second limited so the site isn't overloaded.
 
     Parameters
     ----------
     county_kommun_mapping : dict
         keys are the county and values are a list of all kommuner that belong to the county.
 
+    url_pre : str
+        Start of the web address shared by all kommuner,
+        can be changed to point to a local server for testing.
+
+    max_workers : int
+        Maximum number of pages downloaded at the same time.
+
+    requests_per_second : float
+        Maximum number of requests made to the site per second.
+
+    cache : ResponseCache
+        Local cache of downloaded pages, so unchanged pages aren't downloaded again.
+
     Returns
     -------
     kommuner_info : dict
@@ -42,76 +156,180 @@ def get_kommun_info_paragraph(county_kommun_mapping: dict) -> Tuple[dict, dict,
     fail_list : list
         Any kommun(er) that failed to be extracted. - Now 0 :)
     """
-    url_pre = "https://www.informationsverige.se/en/jag-har-fatt-uppehallstillstand/boende/lan-och-kommuner-i-sverige/"
-    numb_fails = 0
-    fail_list = []
     kommun_urls = {}
-    kommuner_info = {}
-    awkward_kommuners = ["Bollebygd", "Gothenburg", "Hällefors", "Lilla Edet",
-                         "Upplands Väsby", "Ängelholm", "Östra Göinge"]
     for county, kommunerlist in county_kommun_mapping.items():
-        # First need to fix the names to match webadress formatting.
-        if county == "Västra Götaland":
-            url_county = "vastra-gotalands"
-        elif county not in ["Blekinge", "Kalmar", "Skåne", "Uppsala", "Örebro"]:
-            url_county = county.lower()
-            url_county += "s"
+        for kommun in kommunerlist:
+            kommun_urls.update({kommun: get_kommun_url(county, kommun, url_pre)})
+
+    rate_limiter = RateLimiter(requests_per_second, burst=max_workers)
+    session = requests.Session()
+    # one connection per worker. Failed requests are retried by fetch_with_retries (not the session),
+    # so each retry waits on the rate limiter too.
+    session.mount("https://", HTTPAdapter(max_retries=0, pool_maxsize=max_workers))
+    session.mount("http://", HTTPAdapter(max_retries=0, pool_maxsize=max_workers))
+
+    info_texts = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(get_info_text, url, session, rate_limiter, cache): kommun
+                   for kommun, url in kommun_urls.items()}
+        for numb_done, future in enumerate(as_completed(futures), start=1):
+            info_texts[futures[future]] = future.result()
+            if numb_done % 25 == 0 or numb_done == len(futures):
+                print(f"Got webdata for {numb_done}/{len(futures)} kommuner.")
+    session.close()
+
+    # keep the same order as county_kommun_mapping.
+    kommuner_info = {}
+    fail_list = []
+    for kommun in kommun_urls:
+        if info_texts[kommun] is None:
+            fail_list.append(kommun)
         else:
-            url_county = county.lower()
+            kommuner_info.update({kommun: info_texts[kommun]})
 
-        for pattern in (("ä", "a"), ("å", "a"), ("ö", "o")):
-            url_county = url_county.replace(*pattern)
+    print(f"Getting webdata Data failed {len(fail_list)} times.")
+
+    return kommuner_info, kommun_urls, fail_list
 
+
+# helper function for step 2.
+def find_stale_kommuner(county_kommun_mapping: dict, old_county_kommun_mapping: dict,
+                        kommuner_info: dict, kommun_urls: dict,
+                        url_pre: str = INFO_SVERIGE_URL) -> list:
+    """
+    Work out which kommuner need to be (re-)scraped, given the results of a previous run.
+    A kommun is stale if it is new or has moved county in the county to kommun mapping,
+    if its info text is missing (e.g. failed last time) or if its web address has changed.
+
+    Parameters
+    ----------
+    county_kommun_mapping : dict
+        Current mapping, keys are the county and values are a list of its kommuner.
+
+    old_county_kommun_mapping : dict
+        Mapping the existing info texts and web addresses were built from.
+
+    kommuner_info : dict
+        Existing info texts, kommun name as key.
+
+    kommun_urls : dict
+        Existing web addresses, kommun name as key.
+
+    url_pre : str
+        Start of the web address shared by all kommuner.
+
+    Returns
+    -------
+    list
+        Names of the stale kommuner.
+    """
+    old_kommun_to_county = {kommun: county for county, kommunerlist in
+                            old_county_kommun_mapping.items() for kommun in kommunerlist}
+    stale = []
+    for county, kommunerlist in county_kommun_mapping.items():
         for kommun in kommunerlist:
-            # There are 7 special names that don't follow the general patterns below.
-            # They have to be taken care of manually.
-            if kommun in awkward_kommuners:
-                if kommun == "Bollebygd":
-                    url_kommun = "bollebyggd"
-                elif kommun == "Gothenburg":
-                    url_kommun = "goteborg"
-                elif kommun == "Hällefors":
-                    url_kommun = "hellefors"
-                elif kommun == "Lilla Edet":
-                    url_kommun = "lillaedet"
-                elif kommun == "Upplands Väsby":
-                    url_kommun = "upplandsvasby"
-                elif kommun == "Ängelholm":
-                    url_kommun = "engelholm"
-                elif kommun == "Östra Göinge":
-                    url_kommun = "ostragoinge"
-
-            else:  # the rest can be treated as following a general pattern.
-                url_kommun = kommun.lower()
-                for pattern in (("ä", "a"), ("å", "a"), ("ö", "o")):
-                    url_kommun = url_kommun.replace(*pattern)
-
-            # now I can build each url and webscrape
-            url = url_pre + url_county + "-lan/" + url_kommun
-            kommun_urls.update({kommun: url})  # save me later.
-
-            try:
-                # (random pause to not overload)
-                time.sleep(random.randint(1, 3))
-                response = requests.get(url)
-                soup = BeautifulSoup(response.content, "lxml")
-                info_text = (soup.find("p", class_="ingress")).string
-                kommuner_info.update({kommun: info_text})
-
-            except AttributeError:  # if incorrect web address - now 0 fails :)
-                numb_fails += 1
-                fail_list.append(kommun)
-
-    print(f"Getting webdata Data failed {numb_fails} times.")
+            if (old_kommun_to_county.get(kommun) != county or kommun not in kommuner_info
+                    or kommun_urls.get(kommun) != get_kommun_url(county, kommun, url_pre)):
+                stale.append(kommun)
+    return stale
 
-    return kommuner_info, kommun_urls, fail_list
+
+def load_json(path: str, default=None):
+    """Load a json file, returning default instead if it doesn't exist yet."""
+    try:
+        with open(path, "r") as json_file:
+            return json.load(json_file)
+    except FileNotFoundError:
+        return default
 
 
-def main():
+def write_json(path: str, data) -> None:
+    """Write a json file via a temporary file, so it is never left half written."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as outfile:
+        json.dump(data, outfile)
+    os.replace(tmp_path, path)
+
+
+def update_kommun_info(county_kommun_mapping: dict, incremental: bool = False,
+                       cache: ResponseCache = None, url_pre: str = INFO_SVERIGE_URL,
+                       assets_dir: str = "assets") -> list:
+    """
+    Scrape the info text and web link of each kommun and save them, along with the mapping,
+    to "kommun_info_texts.json", "kommun_urls.json" and "county_kommun_mapping.json".
+
+    Parameters
+    ----------
+    county_kommun_mapping : dict
+        keys are the county and values are a list of all kommuner that belong to the county.
+
+    incremental : bool
+        If True, only the kommuner that are new/changed since the files were last saved are
+        scraped (see find_stale_kommuner), the rest keep their saved text and web link.
+
+    cache : ResponseCache
+        Local cache of downloaded pages.
+
+    url_pre : str
+        Start of the web address shared by all kommuner, see get_kommun_info_paragraph.
+
+    assets_dir : str
+        Folder the json files are read from and saved to.
+
+    Returns
+    -------
+    list
+        Any kommun(er) that failed to be extracted (they keep their old text, if they had one).
+    """
+    mapping_path = os.path.join(assets_dir, "county_kommun_mapping.json")
+    info_path = os.path.join(assets_dir, "kommun_info_texts.json")
+    urls_path = os.path.join(assets_dir, "kommun_urls.json")
+    old_county_kommun_mapping = load_json(mapping_path, {})
+    old_kommuner_info = load_json(info_path, {})
+    old_kommuner_urls = load_json(urls_path, {})
+
+    if incremental:
+        stale = set(find_stale_kommuner(county_kommun_mapping, old_county_kommun_mapping,
+                                        old_kommuner_info, old_kommuner_urls, url_pre))
+        print(f"{len(stale)} new or changed kommuner to scrape.")
+    else:
+        stale = {kommun for kommunerlist in county_kommun_mapping.values()
+                 for kommun in kommunerlist}
+    stale_mapping = {county: [kommun for kommun in kommunerlist if kommun in stale]
+                     for county, kommunerlist in county_kommun_mapping.items()}
+
+    new_kommuner_info, new_kommuner_urls, fail_list = get_kommun_info_paragraph(
+        stale_mapping, url_pre=url_pre, cache=cache)
+
+    # merge with the existing results (in mapping order), kommuner no longer
+    # in the mapping are dropped and any that failed keep their old text.
+    kommuner_info = {}
+    kommuner_urls = {}
+    for county, kommunerlist in county_kommun_mapping.items():
+        for kommun in kommunerlist:
+            if kommun in new_kommuner_info:
+                kommuner_info[kommun] = new_kommuner_info[kommun]
+            elif kommun in old_kommuner_info:
+                kommuner_info[kommun] = old_kommuner_info[kommun]
+            kommuner_urls[kommun] = new_kommuner_urls.get(
+                kommun, old_kommuner_urls.get(kommun))
+
+    # mapping is written last, so if anything before fails the next run still sees the change.
+    write_json(info_path, kommuner_info)
+    write_json(urls_path, kommuner_urls)
+    write_json(mapping_path, county_kommun_mapping)
+    return fail_list
+
+
+def main(offline: bool = False, incremental: bool = False):
     """Obtain County to Municiplaity mappings, then a short bit of
-    introductory text for each kommun and a web link to more info."""
+    introductory text for each kommun and a web link to more info.
+    Downloads are cached in ".http_cache", if offline only the cache is used.
+    If incremental, only kommuner that are new/changed since the last run are scraped."""
+    cache = ResponseCache(offline=offline)
+
     url = "https://en.wikipedia.org/wiki/List_of_municipalities_of_Sweden"
-    df_urls = (pd.read_html(url)[1])
+    df_urls = fetch_url(url, cache=cache, parse=read_html_tables)[1]
     df_urls = df_urls.filter(items=["Municipality", "County"])
 
     # Standardise names by removing the "County" and "Municipality" part from each name.
@@ -126,18 +344,7 @@ def main():
             (df_urls[df_urls["County"].isin([county])])["Municipality"])
         county_municip_dict.update({county: municipality_list})
 
-    with open("assets/county_kommun_mapping.json", "w") as outfile:
-        json.dump(county_municip_dict, outfile)
-
-    kommuner_info, kommuner_urls, fail_list = get_kommun_info_paragraph(
-        county_municip_dict)
-
-    with open("assets/kommun_info_texts.json", "w") as outfile:
-        json.dump(kommuner_info, outfile)
-
-    with open("assets/kommun_urls.json", "w") as outfile:
-        json.dump(kommuner_urls, outfile)
-
+    fail_list = update_kommun_info(county_municip_dict, incremental, cache)
     if len(fail_list) >= 1:
         print(f"Failed to get information for: {fail_list}")
     else:
@@ -145,4 +352,10 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--offline", action="store_true",
+                        help="Only use previously downloaded pages (from .http_cache).")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only scrape kommuner that are new or changed since the last run.")
+    args = parser.parse_args()
+    main(offline=args.offline, incremental=args.incremental)
@@ -1,16 +1,63 @@
 """
 Takes the 4 Statistics Sweden excel files and cleans/reformats them.
-Outputs are saved as ".csv" files in the "assets" folder.
+Also derives a table of ranks and yearly changes for each kommun and county.
+Outputs are saved as ".csv" files in the "assets" folder
+(which data_bundle.py packs into the binary file the web-app loads).
+
+The excel files are processed in parallel (one per process), more can be added to STAT_FILES.
+Tables downloaded from Statistics Sweden's PX-Web API (".json"/".px", see pxweb_data.py)
+can be listed in STAT_FILES in place of an excel file.
 
 Terminology Note:
 The code in this script uses the Swedish words "kommun"/"kommuner"
 (translates to Municipality/Municiplaities in English) for varaiable naming.
 County/Counties (and not län/län) are used however.
 """
+import argparse
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import openpyxl
 import pandas as pd
+from pxweb_data import read_pxweb_file
+
+# name: (Statistics Sweden excel (or PX-Web) file, "kommun" or "county", where to save it without the file extension).
+STAT_FILES = {
+    "rent_kommun": ("stats/Annual_Rent_2016_2022_by_Municipalities.xlsx", "kommun",
+                    "assets/median_rent_kommuner_cleaned"),
+    "rent_county": ("stats/Annual_Rent_2016_2022_by_County.xlsx", "county",
+                    "assets/median_rent_counties_cleaned"),
+    "new_rent_kommun": ("stats/New_Rent_2016_2022_by_Municipalities.xlsx", "kommun",
+                        "assets/median_new_rent_kommuner_cleaned"),
+    "new_rent_county": ("stats/New_Rent_2016_2022_by_County.xlsx", "county",
+                        "assets/median_new_rent_counties_cleaned"),
+}
+
+# Layout every Statistics Sweden excel file must have (checked by read_scb_workbook):
+# a title, a header row with one column per year, one row per kommun/county
+# and then (after an empty row) a block of footnotes.
+SCB_WORKBOOK_SCHEMA = {
+    "region_column": 1,  # column with the kommun/county names (counting from 0).
+    "year_pattern": r"\d{4}",  # header of each year column.
+    "missing_values": [".."],  # how missing data is marked.
+    "max_header_row": 20,  # the header must be in one of the first rows.
+}
+
+RELATION_FILES = {"kommun": "assets/kommuner_list.csv",
+                  "county": "assets/counties_list.csv"}
 
+# pandas 1.5 renamed the to_csv keyword "line_terminator" to "lineterminator" (the old name warns),
+# requirements.txt still allows older versions.
+CSV_LINE_TERMINATOR = ("lineterminator" if tuple(int(part) for part in pd.__version__.split(".")[:2]) >= (1, 5)
+                       else "line_terminator")
 
-def create_label_column(row) -> str:
+# relation tables of a worker process, set once when the process starts (see init_worker).
+worker_relation_tables = {}
+
+
+def create_label_column(rent: pd.Series) -> np.ndarray:
     """
     Helper function to generate a new column which will be used
     to label the choropleth maps. Function used to label missing data
@@ -18,20 +65,122 @@ def create_label_column(row) -> str:
 
     Parameters
     ----------
-    row :
+    rent : pd.Series
+        "Median Rent (SEK)" column, missing data is stored as 0.
 
     Returns
     -------
-    str
-        Column label to show when user hovers mouse over a choropleth map.
+    np.ndarray
+        Label to show for each row when user hovers mouse over a choropleth map.
     """
-    if row["Median Rent (SEK)"] > 0:
-        return "Median Cost: " + str(int(row["Median Rent (SEK)"])) + " SEK"
-    else:
-        return "Missing Data"
+    return np.where(rent > 0, "Median Cost: " + rent.astype(int).astype(str) + " SEK",
+                    "Missing Data")
+
+
+def load_relation_tables() -> dict:
+    """Read the tables of relation ids, {"kommun": df, "county": df}."""
+    return {kommun_or_county: pd.read_csv(path) for kommun_or_county, path in RELATION_FILES.items()}
+
+
+def find_header(rows, schema: dict, excel_path: str) -> tuple:
+    """
+    Helper function to find the header row of a Statistics Sweden excel file
+    and which of its columns are years.
+
+    Returns
+    -------
+    tuple
+        (row number counting from 0, {column number: year}).
+    """
+    for row_number, row in enumerate(rows):
+        if row_number >= schema["max_header_row"]:
+            break
+        year_columns = {column: str(cell).strip() for column, cell in enumerate(row)
+                        if cell is not None and re.fullmatch(schema["year_pattern"], str(cell).strip())}
+        if year_columns:
+            columns = list(year_columns)
+            years = [int(year) for year in year_columns.values()]
+            if (columns != list(range(columns[0], columns[-1] + 1))
+                    or years != list(range(years[0], years[-1] + 1))):
+                raise ValueError(
+                    f"{excel_path}: the year columns in row {row_number + 1} are not consecutive years.")
+            if columns[0] <= schema["region_column"]:
+                raise ValueError(
+                    f"{excel_path}: the year columns in row {row_number + 1} start before the "
+                    f"kommun/county column.")
+            return row_number, year_columns
+    raise ValueError(
+        f"{excel_path}: no header row with years found in the first {schema['max_header_row']} rows.")
+
+
+def read_scb_workbook(excel_path: str, schema: dict = SCB_WORKBOOK_SCHEMA) -> tuple:
+    """
+    Read the table of a Statistics Sweden excel file, finding where it starts and ends
+    (and which columns are years) from the contents of the sheet and checking it has
+    the expected layout. The sheet is streamed (openpyxl read-only mode) and only the
+    kommun/county and year columns are read, stopping where the table ends.
+
+    Parameters
+    ----------
+    excel_path : str
+        Path to excel file.
+
+    schema : dict
+        Expected layout, see SCB_WORKBOOK_SCHEMA.
+
+    Returns
+    -------
+    tuple
+        (pd.DataFrame, list of years). The dataframe has the kommun/county names in
+        the "Unnamed: 1" column and one column per year (missing data is NaN).
+    """
+    workbook = openpyxl.load_workbook(
+        excel_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        header_row, year_columns = find_header(
+            sheet.iter_rows(values_only=True), schema, excel_path)
+        first_column = schema["region_column"]
+        last_column = max(year_columns)
 
+        regions = []
+        values = []
+        # excel rows/columns count from 1.
+        for row_number, row in enumerate(sheet.iter_rows(min_row=header_row + 2, min_col=first_column + 1,
+                                                         max_col=last_column + 1, values_only=True),
+                                         start=header_row + 2):
+            if row[0] is None or str(row[0]).strip() == "":
+                break  # the footnotes start after the table.
+            if not isinstance(row[0], str):
+                raise ValueError(
+                    f"{excel_path}: row {row_number} has {row[0]!r} instead of a kommun/county name.")
+            row_values = []
+            for column in year_columns:
+                cell = row[column - first_column] if column - first_column < len(row) else None
+                if cell is None or cell in schema["missing_values"]:
+                    row_values.append(np.nan)
+                elif isinstance(cell, (int, float)):
+                    row_values.append(cell)
+                else:
+                    raise ValueError(
+                        f"{excel_path}: row {row_number} has {cell!r} instead of a number for "
+                        f"{year_columns[column]}.")
+            regions.append(row[0])
+            values.append(row_values)
+    finally:
+        workbook.close()
 
-def process_stat_data(excel_path: str, kommun_or_county: str) -> pd.DataFrame:
+    if not regions:
+        raise ValueError(f"{excel_path}: the table has no rows.")
+    years = list(year_columns.values())
+    df = pd.DataFrame(np.array(values, dtype=float).reshape(len(values), len(years)),
+                      columns=years)
+    df.insert(0, "Unnamed: 1", regions)
+    return df, years
+
+
+def process_stat_data(excel_path: str, kommun_or_county: str,
+                      df_relations: pd.DataFrame = None) -> pd.DataFrame:
     """
     Takes a Statistics Sweden excel file and reformats for easy processing
     in the web-app.
@@ -39,38 +188,64 @@ def process_stat_data(excel_path: str, kommun_or_county: str) -> pd.DataFrame:
     Parameters
     ----------
     excel_path : str
-        Path to excel file.
+        Path to excel file, or to a ".json"/".px" file from the PX-Web API (see pxweb_data.py).
 
     kommun_or_county : str
         Defines if dataset is at the kommun or county level.
 
+    df_relations : pd.DataFrame
+        Relation ids of each kommun/county (see load_relation_tables),
+        read from the "assets" folder if not given.
+
     Returns
     -------
     pd.DataFrame
         Dataframe reformatted for easy plotting with Plotly library.
     """
-    columns_keep = [1, 4, 5, 6, 7, 8, 9, 10]  # same for all.
-    # same for all.
-    years = ["2016", "2017", "2018", "2019", "2020", "2021", "2022"]
-
-    if kommun_or_county == "kommun":
-        skip_rows = [0, 1] + list(range(294, 355))
-        df_relations = pd.read_csv("assets/kommuner_list.csv")
-    elif kommun_or_county == "county":
-        skip_rows = [0, 1] + list(range(25, 81))
-        df_relations = pd.read_csv("assets/counties_list.csv")
-    else:
+    if kommun_or_county not in ["kommun", "county"]:
         raise ValueError(
             "You didn't choose between 'kommun' or 'county' for the 2nd parameter.")
+    if df_relations is None:
+        df_relations = pd.read_csv(RELATION_FILES[kommun_or_county])
+
+    if excel_path.endswith((".json", ".px")):
+        df, years = read_pxweb_file(excel_path)
+    else:
+        df, years = read_scb_workbook(excel_path)
+    return reformat_stat_data(df, years, kommun_or_county, df_relations)
+
+
+def reformat_stat_data(df: pd.DataFrame, years: list, kommun_or_county: str,
+                       df_relations: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reformat a table of Statistics Sweden data (one row per kommun/county, one column per year)
+    for easy plotting, see process_stat_data.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Table with the kommun/county names in the "Unnamed: 1" column and a column for each year.
 
-    df_raw = pd.read_excel(excel_path, skiprows=skip_rows,
-                           na_values=[".."], usecols=columns_keep)
-    # read_excel always seem to keep an extra row.
-    df = df_raw.drop(df_raw.tail(1).index, axis=0)
+    years : list
+        Names of the year columns.
+
+    kommun_or_county : str
+        Defines if dataset is at the kommun or county level.
+
+    df_relations : pd.DataFrame
+        Relation ids of each kommun/county (see load_relation_tables).
+
+    Returns
+    -------
+    pd.DataFrame
+        Dataframe reformatted for easy plotting with Plotly library.
+    """
     df = df.rename(columns={"Unnamed: 1": kommun_or_county})
     df[kommun_or_county] = df[kommun_or_county].str.replace(
-        "\d+", "", regex=True)
-    df = df.applymap(lambda x: x.strip() if isinstance(x, str) else x)
+        r"\d+", "", regex=True)
+    # strip text column by column, anything that isn't text is left as is.
+    for column in df.select_dtypes(include="object"):
+        df[column] = df[column].str.strip().fillna(df[column])
     df = df.fillna(0)
     # add relation id.
     df = df.merge(df_relations, on=kommun_or_county, how="inner")
@@ -79,34 +254,179 @@ def process_stat_data(excel_path: str, kommun_or_county: str) -> pd.DataFrame:
     df = df.rename(columns={"variable": "Year", "value": "Median Rent (SEK)"})
 
     # Extra column to label when there is no rent data for a region.
-    df["Map Label"] = df.apply(create_label_column, axis=1)
+    df["Map Label"] = create_label_column(df["Median Rent (SEK)"])
+
+    return df
+
+
+def create_stats_table(df: pd.DataFrame, kommun_or_county: str,
+                       df_county: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Derive statistics for each kommun/county and year from a processed dataframe,
+    so the web-app only has to look them up.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Output of process_stat_data.
+
+    kommun_or_county : str
+        Defines if dataset is at the kommun or county level.
+
+    df_county : pd.DataFrame
+        County level output of process_stat_data for the same statistic.
+        Only needed (and used) for kommun level datasets.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per kommun/county and year with the columns:
+        "Rank" (1 = most expensive that year), "Change (SEK)" and "Change (%)" from the year before.
+        Kommun level tables also get "County Median Rent (SEK)" and "Percent of County Median".
+        Any statistic that can't be calculated due to missing data is left empty.
+    """
+    if kommun_or_county not in ["kommun", "county"]:
+        raise ValueError(
+            "You didn't choose between 'kommun' or 'county' for the 2nd parameter.")
+
+    df_stats = df[[kommun_or_county, "Relation", "Year", "Median Rent (SEK)"]].copy()
+    df_stats = df_stats.sort_values(by=["Year"], kind="stable")
+    # missing data is stored as 0.
+    rent = df_stats["Median Rent (SEK)"].where(df_stats["Median Rent (SEK)"] > 0)
+
+    df_stats["Rank"] = rent.groupby(df_stats["Year"]).rank(
+        method="min", ascending=False)
+    rent_last_year = rent.groupby(df_stats[kommun_or_county]).shift()
+    df_stats["Change (SEK)"] = rent - rent_last_year
+    df_stats["Change (%)"] = rent / rent_last_year * 100 - 100
+
+    if kommun_or_county == "kommun":
+        with open("assets/county_kommun_mapping.json", "r") as json_file:
+            county_kommun_mapping = json.load(json_file)
+        kommun_to_county = {kommun: county + " county" for county, kommuner in county_kommun_mapping.items()
+                            for kommun in kommuner}
+        county_rent = df_county.set_index(["county", "Year"])["Median Rent (SEK)"]
+        county_rent = county_rent.where(county_rent > 0)
+        county_keys = pd.MultiIndex.from_arrays(
+            [df_stats["kommun"].map(kommun_to_county), df_stats["Year"]])
+        df_stats["County Median Rent (SEK)"] = county_rent.reindex(
+            county_keys).to_numpy()
+        df_stats["Percent of County Median"] = rent / \
+            df_stats["County Median Rent (SEK)"] * 100
+
+    return df_stats
+
+
+def write_atomic(path: str, write, mode: str = "w") -> None:
+    """
+    Helper function to save a file via a temporary file, so it is never half written
+    (e.g. if the script is stopped, or the web-app reads it while it is being saved).
+
+    Parameters
+    ----------
+    path : str
+        Where to save the file.
+
+    write : callable
+        Called with the open temporary file, writes the contents.
+
+    mode : str
+        "w" for text or "wb" for binary.
+    """
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    if mode == "w":
+        outfile = open(tmp_path, mode, encoding="utf-8", newline="")
+    else:
+        outfile = open(tmp_path, mode)
+    with outfile:
+        write(outfile)
+    os.replace(tmp_path, path)
+
+
+def save_csv(df: pd.DataFrame, path: str) -> None:
+    """Save a dataframe as a .csv file (atomically)."""
+    write_atomic(path, lambda outfile: df.to_csv(
+        outfile, index=False, **{CSV_LINE_TERMINATOR: "\n"}))
+
+
+def init_worker(relation_tables: dict) -> None:
+    """Runs once in each worker process, so the relation tables are only sent to it once."""
+    worker_relation_tables.update(relation_tables)
+
+
+def ingest_stat_file(excel_path: str, kommun_or_county: str, out_path: str) -> pd.DataFrame:
+    """
+    Process one Statistics Sweden excel file and save the result (as out_path + ".csv").
+    Runs in a worker process.
 
+    Returns
+    -------
+    pd.DataFrame
+        Output of process_stat_data.
+    """
+    df = process_stat_data(excel_path, kommun_or_county,
+                           worker_relation_tables.get(kommun_or_county))
+    save_csv(df, out_path + ".csv")
     return df
 
 
-def main():
+def ingest_stat_files(stat_files: dict, max_workers: int = None) -> dict:
+    """
+    Process and save many Statistics Sweden excel files at once, each in its own process.
+
+    Parameters
+    ----------
+    stat_files : dict
+        name: (excel_path, kommun_or_county, out_path), same layout as STAT_FILES.
+
+    max_workers : int
+        Number of processes to use, defaults to one per file (up to the number of CPUs).
+
+    Returns
+    -------
+    dict
+        name: output of process_stat_data.
+    """
+    if max_workers is None:
+        max_workers = min(len(stat_files), os.cpu_count() or 1)
+    relation_tables = load_relation_tables()
+
+    if max_workers <= 1:
+        init_worker(relation_tables)
+        return {name: ingest_stat_file(*job) for name, job in stat_files.items()}
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker,
+                             initargs=(relation_tables,)) as executor:
+        futures = {name: executor.submit(ingest_stat_file, *job)
+                   for name, job in stat_files.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def save_stats_tables(df_rent_kommun: pd.DataFrame = None, df_rent_county: pd.DataFrame = None) -> None:
+    """
+    Derive statistics (ranks, yearly changes) based on the annual rent and save them.
+    The annual rent tables are read from the "assets" folder if not given.
+    """
+    if df_rent_kommun is None:
+        df_rent_kommun = pd.read_csv(STAT_FILES["rent_kommun"][2] + ".csv", dtype={"Year": str})
+    if df_rent_county is None:
+        df_rent_county = pd.read_csv(STAT_FILES["rent_county"][2] + ".csv", dtype={"Year": str})
+    df_stats_kommun = create_stats_table(
+        df_rent_kommun, "kommun", df_county=df_rent_county)
+    df_stats_county = create_stats_table(df_rent_county, "county")
+    save_csv(df_stats_kommun, "assets/rent_stats_kommuner.csv")
+    save_csv(df_stats_county, "assets/rent_stats_counties.csv")
+
+
+def main(max_workers: int = None):
     """Processes excel files and saves output to .csv files."""
-    path_rent_kommun = "stats/Annual_Rent_2016_2022_by_Municipalities.xlsx"
-    path_rent_county = "stats/Annual_Rent_2016_2022_by_County.xlsx"
-    path_new_rent_kommun = "stats/New_Rent_2016_2022_by_Municipalities.xlsx"
-    path_new_rent_county = "stats/New_Rent_2016_2022_by_County.xlsx"
-
-    dfs = {}
-    dfs["rent_kommun"] = process_stat_data(path_rent_kommun, "kommun")
-    dfs["new_rent_kommun"] = process_stat_data(path_new_rent_kommun, "kommun")
-    dfs["rent_county"] = process_stat_data(path_rent_county, "county")
-    dfs["new_rent_county"] = process_stat_data(path_new_rent_county, "county")
-
-    # save these for later use with Dash/Plotly.
-    dfs["rent_kommun"].to_csv(
-        "assets/median_rent_kommuner_cleaned.csv", index=False, line_terminator="\n")
-    dfs["rent_county"].to_csv(
-        "assets/median_rent_counties_cleaned.csv", index=False, line_terminator="\n")
-    dfs["new_rent_kommun"].to_csv(
-        "assets/median_new_rent_kommuner_cleaned.csv", index=False, line_terminator="\n")
-    dfs["new_rent_county"].to_csv(
-        "assets/median_new_rent_counties_cleaned.csv", index=False, line_terminator="\n")
+    dfs = ingest_stat_files(STAT_FILES, max_workers)
+    save_stats_tables(dfs["rent_kommun"], dfs["rent_county"])
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of excel files to process at once (default: one per file, up to the number of CPUs).")
+    args = parser.parse_args()
+    main(max_workers=args.workers)
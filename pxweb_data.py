@@ -0,0 +1,343 @@
+"""
+Reads Statistics Sweden data downloaded straight from their PX-Web API, as an alternative to
+the excel files exported by hand from the website (see "stats/Sources.txt").
+
+Both formats the API can send the data tables in are supported, JSON-stat (versions 1 and 2,
+".json" files) and PC-Axis (".px" files). read_pxweb_file turns either into the same table
+read_scb_workbook in prepare_rent_data.py gets from an excel file, so a PX-Web file can be listed
+in prepare_rent_data.STAT_FILES in place of an excel file.
+
+Run this script to download a table, e.g. (the median annual rent per kommun):
+python pxweb_data.py stats/Annual_Rent_by_Municipalities.json --select Region=* --select Tid=*
+(see build_query, the codes of each variable are listed by the API at PXWEB_TABLE_URL).
+
+Terminology Note:
+The code in this script uses the Swedish words "kommun"/"kommuner"
+(translates to Municipality/Municiplaities in English) for varaiable naming.
+County/Counties (and not län/län) are used however.
+"""
+import argparse
+import json
+import os
+import re
+import numpy as np
+import pandas as pd
+from web_helpers import fetch_url
+
+# PX-Web API address of the table the files in "stats" were exported from.
+PXWEB_TABLE_URL = "https://api.scb.se/OV0104/v1/doris/en/ssd/START/BO/BO0406/BO0406E/BO0406Tab01"
+
+# names the kommun/county and year variables usually have, if the file doesn't say which they are.
+REGION_NAMES = ["region"]
+TIME_NAMES = ["tid", "year", "år"]
+
+
+def build_query(selection: dict, response_format: str = "json-stat2") -> dict:
+    """
+    Build a PX-Web API query.
+
+    Parameters
+    ----------
+    selection : dict
+        variable code: list of value codes to download, or "*" for all of them.
+
+    response_format : str
+        "json-stat2", "json-stat" or "px".
+
+    Returns
+    -------
+    dict
+        Query to POST to the table's API address.
+    """
+    query = []
+    for code, values in selection.items():
+        if values == "*":
+            query.append({"code": code, "selection": {"filter": "all", "values": ["*"]}})
+        else:
+            query.append({"code": code, "selection": {"filter": "item", "values": list(values)}})
+    return {"query": query, "response": {"format": response_format}}
+
+
+def download_table(out_path: str, selection: dict, url: str = PXWEB_TABLE_URL) -> None:
+    """
+    Download a table from the PX-Web API and save it (via a temporary file, so it is never half written).
+    The file extension of out_path (".json" or ".px") decides the format.
+    """
+    response_format = "px" if out_path.endswith(".px") else "json-stat2"
+    query = json.dumps(build_query(selection, response_format)).encode("utf-8")
+    body = fetch_url(url, data=query)
+    tmp_path = f"{out_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as outfile:
+        outfile.write(body)
+    os.replace(tmp_path, out_path)
+
+
+def find_variable(names: list, candidates: list, given: str = None) -> str:
+    """Helper function to pick the kommun/county or year variable out of a table's variables."""
+    if given is not None:
+        if given not in names:
+            raise ValueError(f"The table has no variable {given!r}, it has: {names}.")
+        return given
+    for name in names:
+        if name.lower() in candidates:
+            return name
+    raise ValueError(f"Couldn't tell which of the variables {names} is {candidates[0]!r}.")
+
+
+def to_table(values: np.ndarray, variables: list, region: str, time: str,
+             selection: dict = None) -> tuple:
+    """
+    Helper function to turn the values of a PX-Web table (an array with one axis per variable)
+    into one row per kommun/county and one column per year.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values of the table (missing data is NaN).
+
+    variables : list
+        (name, list of value codes, list of value labels) for each axis of values.
+
+    region : str
+        Name of the kommun/county variable.
+
+    time : str
+        Name of the year variable.
+
+    selection : dict
+        variable name: value code, which value to keep of any other variable that has more than one.
+
+    Returns
+    -------
+    tuple
+        (pd.DataFrame, list of years), same as prepare_rent_data.read_scb_workbook.
+    """
+    if selection is None:
+        selection = {}
+    index = []
+    for name, codes, _ in variables:
+        if name in (region, time):
+            index.append(slice(None))
+        elif name in selection:
+            if selection[name] not in codes:
+                raise ValueError(f"{name!r} has no value {selection[name]!r}, it has: {codes}.")
+            index.append(codes.index(selection[name]))
+        elif len(codes) == 1:
+            index.append(0)
+        else:
+            raise ValueError(
+                f"The table has several values of {name!r} ({codes}), choose one with selection.")
+    values = values[tuple(index)]
+    names = [name for name, _, _ in variables if name in (region, time)]
+    if names[0] != region:
+        values = values.T
+
+    variables = {name: (codes, labels) for name, codes, labels in variables}
+    years = [str(code) for code in variables[time][0]]
+    df = pd.DataFrame(values.astype(float), columns=years)
+    df.insert(0, "Unnamed: 1", variables[region][1])
+    return df, years
+
+
+def read_jsonstat(data: dict, region: str = None, time: str = None,
+                  selection: dict = None) -> tuple:
+    """
+    Read a table in JSON-stat format (version 2, or version 1 as sent by PX-Web's "json-stat" format).
+
+    Parameters
+    ----------
+    data : dict
+        The parsed json.
+
+    region : str
+        Id of the kommun/county variable, found from its role ("geo") or name if not given.
+
+    time : str
+        Id of the year variable, found from its role ("time") or name if not given.
+
+    selection : dict
+        See to_table.
+
+    Returns
+    -------
+    tuple
+        (pd.DataFrame, list of years), same as prepare_rent_data.read_scb_workbook.
+    """
+    if "dataset" in data:  # version 1, everything is inside a "dataset".
+        dataset = data["dataset"]
+        dimensions = dataset["dimension"]
+        ids, sizes, roles = dimensions["id"], dimensions["size"], dimensions.get("role", {})
+    else:
+        dataset = data
+        dimensions = dataset["dimension"]
+        ids, sizes, roles = dataset["id"], dataset["size"], dataset.get("role", {})
+
+    variables = []
+    for dimension_id, size in zip(ids, sizes):
+        category = dimensions[dimension_id]["category"]
+        labels = category.get("label", {})
+        index = category.get("index", list(labels))
+        if isinstance(index, dict):
+            codes = sorted(index, key=index.get)
+        else:
+            codes = list(index)
+        if len(codes) != size:
+            raise ValueError(f"{dimension_id!r} has {len(codes)} values but a size of {size}.")
+        variables.append((dimension_id, codes, [labels.get(code, code) for code in codes]))
+
+    values = np.full(int(np.prod(sizes)), np.nan)
+    raw_values = dataset["value"]
+    if isinstance(raw_values, dict):  # only the values that aren't missing, by position.
+        raw_values = {int(position): value for position, value in raw_values.items()}
+        positions = list(raw_values)
+        raw_values = list(raw_values.values())
+    else:
+        positions = range(len(raw_values))
+    if len(raw_values):
+        values[list(positions)] = [np.nan if value is None else value for value in raw_values]
+
+    region = find_variable(ids, REGION_NAMES, region if region is not None
+                           else (roles.get("geo") or [None])[0])
+    time = find_variable(ids, TIME_NAMES, time if time is not None
+                         else (roles.get("time") or [None])[0])
+    return to_table(values.reshape(sizes), variables, region, time, selection)
+
+
+def split_px_values(text: str) -> list:
+    """
+    Helper function to split the value of a PC-Axis keyword into a list, e.g. '"a","b"' -> ["a", "b"].
+    Strings split over several lines ('"ab"\\n"c"') are joined back together.
+    """
+    items = []
+    for item in re.split(r',(?=(?:[^"]*"[^"]*")*[^"]*$)', text):
+        parts = re.findall(r'"([^"]*)"', item)
+        items.append("".join(parts) if parts else item.strip())
+    return items
+
+
+def parse_px_keywords(text: str) -> dict:
+    """
+    Helper function to read the keywords of a PC-Axis file (everything before "DATA=").
+    Only the default language is kept.
+
+    Returns
+    -------
+    dict
+        (keyword, variable or None): value text, e.g. ("VALUES", "region"): '"0114 Upplands Väsby",...'.
+    """
+    keywords = {}
+    # statements end with ";", which can also be inside a quoted string.
+    for statement in re.findall(r'((?:[^";]|"[^"]*")*);', text):
+        statement = statement.strip()
+        if "=" not in statement:
+            continue
+        key, value = statement.split("=", 1)
+        match = re.fullmatch(r'([A-Z0-9-]+)(\[[^\]]*\])?(?:\("([^"]*)"\))?', key.strip())
+        if match is None or match.group(2):  # another language.
+            continue
+        keywords[(match.group(1), match.group(3))] = value.strip()
+    return keywords
+
+
+def read_px(text: str, region: str = None, time: str = None, selection: dict = None) -> tuple:
+    """
+    Read a table in PC-Axis format.
+
+    Parameters
+    ----------
+    text : str
+        Contents of the ".px" file.
+
+    region : str
+        Name of the kommun/county variable, found from its name if not given.
+
+    time : str
+        Name of the year variable, found from TIMEVAL or its name if not given.
+
+    selection : dict
+        See to_table.
+
+    Returns
+    -------
+    tuple
+        (pd.DataFrame, list of years), same as prepare_rent_data.read_scb_workbook.
+    """
+    header, data = re.split(r'^DATA=', text, maxsplit=1, flags=re.MULTILINE)
+    keywords = parse_px_keywords(header)
+
+    names = split_px_values(keywords.get(("STUB", None), "")) + \
+        split_px_values(keywords.get(("HEADING", None), ""))
+    names = [name for name in names if name]
+    variables = []
+    for name in names:
+        labels = split_px_values(keywords[("VALUES", name)])
+        codes = split_px_values(keywords[("CODES", name)]) if ("CODES", name) in keywords else labels
+        variables.append((name, codes, labels))
+
+    # values are listed with the last variable changing fastest, missing data is a quoted symbol e.g. "..".
+    values = []
+    for token in re.findall(r'"[^"]*"|[^\s,;"]+', data.split(";", 1)[0]):
+        try:
+            values.append(float(token))
+        except ValueError:
+            values.append(np.nan)
+    sizes = [len(codes) for _, codes, _ in variables]
+    if len(values) != np.prod(sizes):
+        raise ValueError(f"DATA has {len(values)} values, expected {int(np.prod(sizes))}.")
+
+    if time is None:
+        time_variables = [variable for keyword, variable in keywords
+                          if keyword == "TIMEVAL" and variable in names]
+        time = time_variables[0] if time_variables else None
+    region = find_variable(names, REGION_NAMES, region)
+    time = find_variable(names, TIME_NAMES, time)
+    return to_table(np.array(values).reshape(sizes), variables, region, time, selection)
+
+
+def read_pxweb_file(path: str, region: str = None, time: str = None,
+                    selection: dict = None) -> tuple:
+    """
+    Read a table downloaded from the PX-Web API, ".json" (JSON-stat) or ".px" (PC-Axis).
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+
+    region, time, selection :
+        See read_jsonstat/read_px.
+
+    Returns
+    -------
+    tuple
+        (pd.DataFrame, list of years), same as prepare_rent_data.read_scb_workbook.
+    """
+    with open(path, "rb") as infile:
+        content = infile.read()
+    if path.endswith(".px"):
+        # PC-Axis files name their own encoding, the default is iso-8859-1.
+        codepage = re.search(rb'CODEPAGE="([^"]+)"', content)
+        text = content.decode(codepage.group(1).decode("ascii") if codepage else "iso-8859-1")
+        return read_px(text.lstrip("\ufeff"), region, time, selection)
+    return read_jsonstat(json.loads(content.decode("utf-8-sig")), region, time, selection)
+
+
+def main(out_path: str, selection: dict, url: str = PXWEB_TABLE_URL):
+    """Download a table from Statistics Sweden's PX-Web API (".json" for JSON-stat or ".px")."""
+    download_table(out_path, selection, url)
+    print(f"Saved {out_path} ({os.path.getsize(out_path)} bytes).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("out_path", help="Where to save the table.")
+    parser.add_argument("--select", action="append", default=[], metavar="VARIABLE=VALUES",
+                        help="Values to download of a variable, comma separated codes or * for all. "
+                             "Can be given once per variable.")
+    parser.add_argument("--url", default=PXWEB_TABLE_URL, help="PX-Web API address of the table.")
+    args = parser.parse_args()
+    selection = {}
+    for select in args.select:
+        code, values = select.split("=", 1)
+        selection[code] = "*" if values == "*" else values.split(",")
+    main(args.out_path, selection, args.url)
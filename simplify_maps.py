@@ -0,0 +1,433 @@
+"""
+Simplifies (decreases the resolution of) the geojson map files made by get_geojson_data.py,
+so they load quickly on the web-app. This replaces simplifying the maps by hand with
+mapshaper, so the lightweight maps can be remade whenever the borders are refreshed.
+
+Each map is saved at several resolution levels (see RESOLUTION_LEVELS), e.g.
+"assets/kommuner_map.json" -> "assets/kommuner_map_low_res.json", "assets/kommuner_map_medium_res.json" ...
+
+Lines are simplified with the Douglas-Peucker algorithm. By default the topology is preserved,
+the borders are first split into arcs at the points where kommuner/counties meet, and each
+shared arc is only simplified once. Neighbouring kommuner then still line up exactly,
+instead of leaving gaps/overlaps along their shared border.
+
+Each level is also saved as TopoJSON ("..._low_res.topojson"), which the web-app loads.
+The coordinates are quantized (rounded to a grid) and every shared border is only stored once,
+so these files are far smaller than the geojson versions. See encode_topology/decode_topology.
+
+Terminology Note:
+The code in this script uses the Swedish words "kommun"/"kommuner"
+(translates to Municipality/Municiplaities in English) for varaiable naming.
+County/Counties (and not län/län) are used however.
+"""
+from typing import Tuple
+import argparse
+import json
+import os
+import numpy as np
+
+# level name: tolerance (in degrees), the largest distance a simplified line can be from the original.
+# The web-app picks a level from these (see app.pick_map_level), so they must match how each file was made.
+# The counties levels are made from "assets/counties_map.json" by build_assets.py. The kommuner low res
+# map kept in the repo was made by hand with mapshaper (the full kommuner map isn't kept in the repo),
+# so it is only exact once get_geojson_data.py has been run. For comparison, the mapshaper counties map
+# it replaced was up to 0.035 degrees from the full map (99% of points within 0.016).
+RESOLUTION_LEVELS = {
+    "low_res": 0.01,
+    "medium_res": 0.002,
+    "high_res": 0.0005,
+}
+
+# Number of grid points across the width/height of a map that coordinates are rounded to in
+# the TopoJSON files. 100000 gives roughly 15m steps across Sweden.
+QUANTIZATION = 100000
+
+
+def douglas_peucker(coords: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplify a line with the Douglas-Peucker algorithm. The first and last points are always kept.
+
+    Parameters
+    ----------
+    coords : np.ndarray
+        (n, 2) array of the points along the line. If the first and last point are the same
+        (a closed ring), distances are measured from that point instead of from a line.
+
+    tolerance : float
+        Points closer than this to the simplified line are removed.
+        A tolerance of 0 (or less) keeps every point, even ones exactly on the line.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean mask of the points to keep.
+    """
+    if tolerance <= 0:
+        return np.ones(len(coords), dtype=bool)
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        points = coords[start + 1:end] - coords[start]
+        line = coords[end] - coords[start]
+        line_length = np.hypot(*line)
+        if line_length == 0:
+            distances = np.hypot(points[:, 0], points[:, 1])
+        else:
+            distances = np.abs(
+                line[0] * points[:, 1] - line[1] * points[:, 0]) / line_length
+        furthest = int(np.argmax(distances))
+        if distances[furthest] > tolerance:
+            middle = start + 1 + furthest
+            keep[middle] = True
+            stack.extend([(start, middle), (middle, end)])
+    return keep
+
+
+def get_polygons(geometry: dict) -> list:
+    """Helper function to list the polygons of a Polygon or MultiPolygon geometry."""
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    return geometry["coordinates"]
+
+
+def build_topology(geojson_map: dict) -> Tuple[list, list]:
+    """
+    Split every ring (border) in a map into arcs, where each arc shared by neighbouring
+    kommuner/counties is only stored once.
+    Rings are cut at the points where the neighbouring points differ between the rings
+    that contain it (i.e. where borders meet or split apart).
+
+    Parameters
+    ----------
+    geojson_map : dict
+        geojson FeatureCollection of Polygon/MultiPolygon features.
+
+    Returns
+    -------
+    arcs : list
+        (n, 2) arrays of the points along each arc.
+
+    features_arcs : list
+        For each feature, a list of polygons, each a list of rings, each a list of arc indexes.
+        As in TopoJSON, an index of ~i (i.e. -i - 1) means arc i is used in reverse.
+    """
+    rings = [np.asarray(ring, dtype=float)[:-1]  # last point repeats the first
+             for feature in geojson_map["features"]
+             for polygon in get_polygons(feature["geometry"]) for ring in polygon]
+
+    # give every distinct point an id, shared by all rings that contain it.
+    all_points = np.concatenate(rings)
+    _, point_ids = np.unique(all_points, axis=0, return_inverse=True)
+    point_ids = point_ids.ravel()
+    ring_starts = np.cumsum([0] + [len(ring) for ring in rings])
+    rings_ids = [point_ids[start:end]
+                 for start, end in zip(ring_starts[:-1], ring_starts[1:])]
+
+    # a point is a junction if its (unordered) neighbours differ between occurrences.
+    neighbours = np.concatenate([
+        np.sort(np.column_stack([np.roll(ids, 1), np.roll(ids, -1)]), axis=1) for ids in rings_ids])
+    occurrences = np.unique(np.column_stack([point_ids, neighbours]), axis=0)
+    junction = np.bincount(occurrences[:, 0], minlength=len(all_points)) > 1
+
+    arcs = []
+    arc_lookup = {}  # tuple of point ids: arc index
+
+    def add_arc(arc_ids, arc_coords):
+        key = tuple(arc_ids)
+        if key in arc_lookup:
+            return arc_lookup[key]
+        if key[::-1] in arc_lookup:
+            return ~arc_lookup[key[::-1]]
+        arc_lookup[key] = len(arcs)
+        arcs.append(arc_coords)
+        return arc_lookup[key]
+
+    rings_arcs = []
+    for ring, ids in zip(rings, rings_ids):
+        cuts = np.flatnonzero(junction[ids])
+        if len(cuts) == 0:
+            # no junctions, the whole ring is one closed arc. Start it at its lowest id point,
+            # so the same ring in a neighbouring feature (e.g. around an enclave) gives the same arc.
+            cuts = np.array([np.argmin(ids)])
+        ring_arcs = []
+        for cut_start, cut_end in zip(cuts, np.append(cuts[1:], cuts[0] + len(ids))):
+            order = np.arange(cut_start, cut_end + 1) % len(ids)
+            ring_arcs.append(add_arc(ids[order], ring[order]))
+        rings_arcs.append(ring_arcs)
+
+    # regroup the rings into polygons and features.
+    features_arcs = []
+    ring_number = 0
+    for feature in geojson_map["features"]:
+        polygons_arcs = []
+        for polygon in get_polygons(feature["geometry"]):
+            polygons_arcs.append(
+                rings_arcs[ring_number:ring_number + len(polygon)])
+            ring_number += len(polygon)
+        features_arcs.append(polygons_arcs)
+    return arcs, features_arcs
+
+
+def arcs_to_ring(arcs: list, ring_arcs: list) -> np.ndarray:
+    """Join a ring's arcs (reversing any with a negative index) back into a closed ring."""
+    pieces = []
+    for arc_index in ring_arcs:
+        arc = arcs[arc_index] if arc_index >= 0 else arcs[~arc_index][::-1]
+        pieces.append(arc if not pieces else arc[1:])
+    return np.concatenate(pieces)
+
+
+def build_feature(feature: dict, polygons: list) -> dict:
+    """
+    Helper function to copy a feature with new polygons (a list of lists of (n, 2) ring arrays).
+    Rings that collapse to less than a triangle are dropped, along with the holes of a
+    collapsed outer ring. If every polygon collapses, the polygon with the most points is kept.
+    """
+    kept_polygons = []
+    for rings in polygons:
+        if len(rings[0]) < 4:
+            continue
+        kept_polygons.append([ring for ring in rings if len(ring) >= 4])
+    if not kept_polygons:
+        largest = max(polygons, key=lambda rings: len(rings[0]))
+        kept_polygons = [[largest[0]]]
+
+    new_feature = {key: value for key,
+                   value in feature.items() if key != "geometry"}
+    new_feature["geometry"] = {
+        "type": "MultiPolygon",
+        "coordinates": [[ring.tolist() for ring in rings] for rings in kept_polygons],
+    }
+    return new_feature
+
+
+def simplify_map(geojson_map: dict, tolerance: float, preserve_topology: bool = True) -> dict:
+    """
+    Simplify all features (kommuner/counties) in a map.
+
+    Parameters
+    ----------
+    geojson_map : dict
+        geojson FeatureCollection of Polygon/MultiPolygon features.
+
+    tolerance : float
+        Largest distance (in degrees) a simplified border can be from the original.
+        0 keeps every point, though with preserve_topology a ring can start at a different
+        point (where it meets a neighbour), so the coordinates don't always come back in the same order.
+
+    preserve_topology : bool
+        If True, borders shared by neighbouring features are simplified once so they still
+        line up exactly. If False, each ring is simplified on its own (a little faster).
+
+    Returns
+    -------
+    dict
+        The simplified map, features keep their id and properties.
+    """
+    if preserve_topology:
+        arcs, features_arcs = build_topology(geojson_map)
+        arcs = [arc[douglas_peucker(arc, tolerance)] for arc in arcs]
+        features_polygons = [[[arcs_to_ring(arcs, ring_arcs) for ring_arcs in polygon_arcs]
+                              for polygon_arcs in polygons_arcs]
+                             for polygons_arcs in features_arcs]
+    else:
+        features_polygons = []
+        for feature in geojson_map["features"]:
+            polygons = []
+            for polygon in get_polygons(feature["geometry"]):
+                rings = [np.asarray(ring, dtype=float) for ring in polygon]
+                polygons.append([ring[douglas_peucker(ring, tolerance)]
+                                for ring in rings])
+            features_polygons.append(polygons)
+
+    simplified_map = {key: value for key,
+                      value in geojson_map.items() if key != "features"}
+    simplified_map["features"] = [build_feature(feature, polygons) for feature, polygons
+                                  in zip(geojson_map["features"], features_polygons)]
+    return simplified_map
+
+
+def encode_topology(geojson_map: dict, quantization: int = QUANTIZATION, object_name: str = "map") -> dict:
+    """
+    Encode a map as TopoJSON (https://github.com/topojson/topojson-specification).
+    Coordinates are quantized to integers on a grid and each arc (shared border) is stored
+    once, as the difference between each point and the one before.
+
+    Parameters
+    ----------
+    geojson_map : dict
+        geojson FeatureCollection of Polygon/MultiPolygon features.
+
+    quantization : int
+        Number of grid points across the width/height of the map.
+
+    object_name : str
+        Name of the object the features are stored under.
+
+    Returns
+    -------
+    dict
+        The TopoJSON Topology, features keep their id and properties.
+    """
+    all_points = np.concatenate([np.asarray(ring, dtype=float) for feature in geojson_map["features"]
+                                 for polygon in get_polygons(feature["geometry"]) for ring in polygon])
+    translate = all_points.min(axis=0)
+    scale = (all_points.max(axis=0) - translate) / (quantization - 1)
+    scale[scale == 0] = 1
+
+    # quantize each ring, dropping points that round onto the point before.
+    quantized_features = []
+    for feature in geojson_map["features"]:
+        polygons = []
+        for polygon in get_polygons(feature["geometry"]):
+            rings = []
+            for ring in polygon:
+                ring = np.round((np.asarray(ring, dtype=float) -
+                                translate) / scale).astype(np.int64)
+                moved = np.append(True, (np.diff(ring, axis=0) != 0).any(axis=1))
+                rings.append(ring[moved] if moved.sum() >= 4 else ring)
+            polygons.append(rings)
+        quantized_features.append(
+            {"geometry": {"type": "MultiPolygon", "coordinates": polygons}})
+    arcs, features_arcs = build_topology({"features": quantized_features})
+
+    geometries = []
+    for feature, polygons_arcs in zip(geojson_map["features"], features_arcs):
+        geometry = {"type": "MultiPolygon", "arcs": polygons_arcs}
+        geometry.update({key: value for key, value in feature.items()
+                        if key not in ("type", "geometry")})
+        geometries.append(geometry)
+
+    return {
+        "type": "Topology",
+        "transform": {"scale": scale.tolist(), "translate": translate.tolist()},
+        "objects": {object_name: {"type": "GeometryCollection", "geometries": geometries}},
+        "arcs": [np.vstack([arc[:1], np.diff(arc, axis=0)]).astype(np.int64).tolist()
+                 for arc in arcs],
+    }
+
+
+def decode_topology(topology: dict, object_name: str = None) -> dict:
+    """
+    Decode a TopoJSON Topology made by encode_topology back to a geojson FeatureCollection.
+    Coordinates are rounded to the number of decimals the quantization grid needs.
+
+    Parameters
+    ----------
+    topology : dict
+        The TopoJSON Topology.
+
+    object_name : str
+        Object to decode, defaults to the first (only) one.
+
+    Returns
+    -------
+    dict
+        geojson FeatureCollection of MultiPolygon features.
+    """
+    if object_name is None:
+        object_name = next(iter(topology["objects"]))
+    scale = np.asarray(topology["transform"]["scale"])
+    translate = np.asarray(topology["transform"]["translate"])
+    decimals = int(max(0, -np.floor(np.log10(scale.min())))) + 1
+    arcs = [np.round(np.cumsum(np.asarray(arc), axis=0) * scale + translate, decimals)
+            for arc in topology["arcs"]]
+
+    features = []
+    for geometry in topology["objects"][object_name]["geometries"]:
+        feature = {"type": "Feature"}
+        feature.update({key: value for key, value in geometry.items()
+                        if key not in ("type", "arcs")})
+        feature["geometry"] = {
+            "type": "MultiPolygon",
+            "coordinates": [[arcs_to_ring(arcs, ring_arcs).tolist() for ring_arcs in polygon_arcs]
+                            for polygon_arcs in geometry["arcs"]],
+        }
+        features.append(feature)
+    return {"type": "FeatureCollection", "features": features}
+
+
+def write_topojson(geojson_map: dict, path: str, quantization: int = QUANTIZATION) -> None:
+    """Helper function to save a map as TopoJSON (compactly, it is only read by code)."""
+    with open(path, "w") as outfile:
+        json.dump(encode_topology(geojson_map, quantization),
+                  outfile, separators=(",", ":"))
+
+
+def count_points(geojson_map: dict) -> int:
+    """Helper function to count the points in a map, to report how much it was simplified."""
+    return sum(len(ring) for feature in geojson_map["features"]
+               for polygon in get_polygons(feature["geometry"]) for ring in polygon)
+
+
+def write_resolution_levels(map_path: str, levels: dict = None, preserve_topology: bool = True) -> list:
+    """
+    Simplify a map file to each resolution level and save them next to it,
+    as both geojson and TopoJSON.
+
+    Parameters
+    ----------
+    map_path : str
+        Full resolution map, e.g. "assets/kommuner_map.json".
+
+    levels : dict
+        level name: tolerance, defaults to RESOLUTION_LEVELS.
+
+    preserve_topology : bool
+        Passed on to simplify_map.
+
+    Returns
+    -------
+    list
+        Paths of the saved maps, e.g. "assets/kommuner_map_low_res.json".
+    """
+    if levels is None:
+        levels = RESOLUTION_LEVELS
+    with open(map_path, "r") as json_file:
+        geojson_map = json.load(json_file)
+
+    paths = []
+    for level, tolerance in levels.items():
+        simplified_map = simplify_map(
+            geojson_map, tolerance, preserve_topology)
+        path = f"{os.path.splitext(map_path)[0]}_{level}.json"
+        with open(path, "w") as outfile:
+            json.dump(simplified_map, outfile)
+        write_topojson(simplified_map, os.path.splitext(path)[0] + ".topojson")
+        print(f"{path}: {count_points(simplified_map)}/{count_points(geojson_map)} points kept.")
+        paths.append(path)
+    return paths
+
+
+def main(map_paths: list, preserve_topology: bool = True, encode_only: bool = False, levels: list = None):
+    """Simplify each full resolution map to every resolution level (or only those in levels)
+    or only save each map as TopoJSON if encode_only."""
+    for map_path in map_paths:
+        if encode_only:
+            with open(map_path, "r") as json_file:
+                write_topojson(json.load(json_file),
+                               os.path.splitext(map_path)[0] + ".topojson")
+        else:
+            write_resolution_levels(
+                map_path, None if levels is None else {level: RESOLUTION_LEVELS[level] for level in levels},
+                preserve_topology=preserve_topology)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument("map_paths", nargs="*",
+                        default=["assets/kommuner_map.json", "assets/counties_map.json"],
+                        help="Full resolution maps made by get_geojson_data.py.")
+    parser.add_argument("--no-topology", action="store_true",
+                        help="Simplify each border on its own, shared borders may no longer line up.")
+    parser.add_argument("--encode-only", action="store_true",
+                        help="Don't simplify, only save each map as TopoJSON.")
+    parser.add_argument("--levels", nargs="+", choices=list(RESOLUTION_LEVELS), default=None,
+                        help="Resolution levels to make (default: all of them).")
+    args = parser.parse_args()
+    main(args.map_paths, preserve_topology=not args.no_topology,
+         encode_only=args.encode_only, levels=args.levels)
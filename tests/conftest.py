@@ -0,0 +1,86 @@
+"""
+Shared set up for the tests. The scripts live in the main folder and use paths relative to it
+(e.g. "assets/kommuner_list.csv"), so it is added to the import path and each test runs from it.
+The web scraping tests download from a local server (see stub_server) instead of the real websites.
+"""
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+def pytest_configure(config):
+    """app.py opens the data bundle when it is imported, so build it first if it is out of date
+    (as is done before starting the web-app)."""
+    from data_bundle import BundleError, build_bundle, open_bundle
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        open_bundle()
+    except BundleError:
+        build_bundle()
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(autouse=True)
+def run_from_repo_root(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+
+
+class StubServer(ThreadingHTTPServer):
+    """
+    Local HTTP server that replies with canned responses.
+
+    routes maps a path (e.g. "/page?id=1") to a list of responses, each (status, body, headers)
+    or a function called with the request headers that returns one. The responses are sent in
+    order, the last one is repeated for any further requests. Paths without a route get a 404.
+    Every request is recorded in requests as (path, request headers, time received).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.routes = {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def next_response(self, path: str, headers) -> tuple:
+        with self.lock:
+            self.requests.append((path, headers, time.monotonic()))
+            responses = self.routes.get(path)
+            if not responses:
+                return 404, b"Not Found", {}
+            response = responses.pop(0) if len(responses) > 1 else responses[0]
+        return response(headers) if callable(response) else response
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        status, body, headers = self.server.next_response(self.path, self.headers)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # keep the test output clean.
+
+
+@pytest.fixture
+def stub_server():
+    """A running StubServer, see its url and routes."""
+    server = StubServer()
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,164 @@
+"""
+Tests for the data loading, caches and map serving of app.py (the callbacks themselves aren't tested).
+"""
+import copy
+import gzip
+import json
+import math
+import threading
+import urllib.parse
+import pytest
+import app
+from simplify_maps import RESOLUTION_LEVELS
+
+
+def test_lazy_data_loads_once():
+    calls = []
+    lazy = app.LazyData("test")
+
+    @lazy.loader("a", "b")
+    def load(key):
+        calls.append(key)
+        return key * 2
+
+    assert lazy["a"] == "aa"
+    assert lazy["a"] == "aa"
+    assert lazy["b"] == "bb"
+    assert calls == ["a", "b"]
+
+
+def test_lazy_data_loaders_run_at_the_same_time():
+    # each loader waits for the other to start, so this only finishes if neither blocks the other.
+    first, second = app.LazyData("first"), app.LazyData("second")
+    started = {name: threading.Event() for name in ("first", "other key", "second")}
+
+    def make_loader(name, other):
+        def load(key):
+            started[name].set()
+            return started[other].wait(timeout=5)
+        return load
+
+    first.loader("a")(make_loader("first", "second"))
+    first.loader("b")(make_loader("other key", "first"))
+    second.loader("a")(make_loader("second", "other key"))
+    results = {}
+    threads = [threading.Thread(target=lambda name=name, lazy=lazy, key=key: results.update({name: lazy[key]}))
+               for name, lazy, key in [("first", first, "a"), ("other key", first, "b"), ("second", second, "a")]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"first": True, "other key": True, "second": True}
+
+
+@pytest.fixture
+def client():
+    return app.app.server.test_client()
+
+
+def zoom_for(degrees_per_pixel: float) -> float:
+    """mapbox zoom level where one pixel is this many degrees wide (inverse of pick_map_level's maths)."""
+    return math.log2(360 / (512 * degrees_per_pixel))
+
+
+def test_pick_map_level(monkeypatch):
+    monkeypatch.setitem(app.data, "map_levels", {"kommuner": ["low_res"],
+                                                 "counties": ["low_res", "medium_res", "high_res"]})
+    assert app.pick_map_level("counties") == "low_res"
+    # Sweden-wide views (zoom ~4) are far coarser than a pixel per 0.01 degrees.
+    assert app.pick_map_level("counties", 4.1) == "low_res"
+    # a level is used up to the zoom where it is off by a pixel, then the next sharper one.
+    for level, sharper_level in [("low_res", "medium_res"), ("medium_res", "high_res")]:
+        boundary = zoom_for(RESOLUTION_LEVELS[level])
+        assert app.pick_map_level("counties", boundary - 1e-6) == level
+        assert app.pick_map_level("counties", boundary + 1e-6) == sharper_level
+    # nothing is sharper than high res.
+    assert app.pick_map_level("counties", zoom_for(RESOLUTION_LEVELS["high_res"]) + 1) == "high_res"
+    # levels that aren't available fall back to the sharpest one that is.
+    assert app.pick_map_level("kommuner", 10) == "low_res"
+
+
+def test_map_levels_kept_in_the_repo():
+    assert app.data["map_levels"]["counties"] == list(RESOLUTION_LEVELS)
+    assert "low_res" in app.data["map_levels"]["kommuner"]
+
+
+def test_serve_map(client):
+    response = client.get("/maps/counties.json?level=medium_res")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == "public, max-age=31536000"
+    etag = response.headers["ETag"]
+    geojson_map = json.loads(response.data)
+    assert len(geojson_map["features"]) == 21
+    assert etag.strip('"') == app.build_map_file("counties", "medium_res")[2]
+
+    # the browser already has it.
+    response = client.get("/maps/counties.json?level=medium_res", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get("/maps/counties.json?level=medium_res", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(response.data)) == geojson_map
+
+
+def test_serve_map_of_one_county(client):
+    response = client.get("/maps/kommuner.json?county=" + urllib.parse.quote("Skåne"))
+    assert response.status_code == 200
+    ids = [feature["id"] for feature in json.loads(response.data)["features"]]
+    skane_ids = {app.data["kommun_to_relation"][kommun] for kommun in app.data["county_kommun_mapping"]["Skåne"]}
+    assert len(ids) == 33
+    assert set(ids) == skane_ids
+    # each county gets its own file (and ETag).
+    other_etag = client.get("/maps/kommuner.json?county=Gotland").headers["ETag"]
+    assert response.headers["ETag"] != other_etag
+
+
+@pytest.mark.parametrize("url", [
+    "/maps/sweden.json",  # no such map.
+    "/maps/counties.json?level=ultra_res",  # no such level.
+    "/maps/kommuner.json?level=high_res",  # level not available.
+    "/maps/kommuner.json?county=Atlantis",  # no such county.
+    "/maps/counties.json?county=Sk%C3%A5ne",  # only the kommuner map can be split by county.
+])
+def test_serve_map_not_found(client, url):
+    assert client.get(url).status_code == 404
+
+
+def test_get_map_geojson_url(client):
+    url = app.get_map_geojson("kommuner", 8, "Skåne")
+    path, query = url.split("?")
+    assert path == "/maps/kommuner.json"
+    params = urllib.parse.parse_qs(query)
+    assert params["county"] == ["Skåne"]
+    assert params["level"] == ["low_res"]
+    assert params["v"] == [app.build_map_file("kommuner", "low_res", "Skåne")[2]]
+    assert client.get(url).status_code == 200
+
+
+def test_get_map_view():
+    center, zoom = app.get_map_view("kommuner", app.get_county_relations("Skåne"))
+    # Skåne is in the far south of Sweden, about 2.5 degrees wide.
+    assert 55.3 < center["lat"] < 56.6 and 12.4 < center["lon"] < 14.6
+    assert 6 < zoom < 8
+    _, sweden_zoom = app.get_map_view("counties", tuple(
+        feature["id"] for feature in app.load_map("counties")["features"]))
+    assert 3 <= sweden_zoom < zoom
+
+
+def test_specifics_page_cache(client, monkeypatch):
+    app.build_specifics_page.cache_clear()
+    first_page = app.update_specifics_page.__wrapped__("Ale")
+    assert app.update_specifics_page.__wrapped__("Ale") is first_page
+
+    def specifics_page_stats():
+        stats = json.loads(client.get("/cache-stats").data)["specifics_page"]
+        return stats["hits"], stats["misses"]
+    assert specifics_page_stats() == (1, 1)
+
+    # a rebuilt bundle (with different data) doesn't re-use the pages built from the old one.
+    rebuilt_bundle = copy.copy(app.data["bundle"])
+    rebuilt_bundle.content_hash = "rebuilt"
+    monkeypatch.setitem(app.data, "bundle", rebuilt_bundle)
+    assert app.update_specifics_page.__wrapped__("Ale") is not first_page
+    assert specifics_page_stats() == (1, 2)
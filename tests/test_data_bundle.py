@@ -0,0 +1,83 @@
+"""
+Tests for the memory-mapped data bundle the web-app loads (data_bundle.py), built from small files.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from data_bundle import BundleError, DataBundle, build_bundle, open_bundle
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """A rent table (as saved by prepare_rent_data.py), a stats table and a json file."""
+    pd.DataFrame({
+        "kommun": ["Ale", "Ale", "Lund", "Lund"], "Relation": [1, 1, 2, 2], "Year": [2021, 2022, 2021, 2022],
+        "Median Rent (SEK)": [0.0, 1000.0, 1100.0, 1200.0],
+        "Map Label": ["Missing Data", "1000", "1100", "1200"],
+    }).to_csv(tmp_path / "rent_cleaned.csv", index=False)
+    pd.DataFrame({"kommun": ["Lund", "Ale"], "Year": [2022, 2022], "Rank": [1.0, np.nan]}).to_csv(
+        tmp_path / "stats.csv", index=False)
+    (tmp_path / "mapping.json").write_text(json.dumps({"Skåne": ["Lund"], "Västra Götaland": ["Ale"]}))
+    return {"rent": ("rent_table", str(tmp_path / "rent_cleaned")),
+            "stats": ("csv", str(tmp_path / "stats.csv")),
+            "mapping": ("json", str(tmp_path / "mapping.json"))}
+
+
+def test_round_trip(sources, tmp_path):
+    bundle_path = str(tmp_path / "bundle.bin")
+    build_bundle(bundle_path, sources)
+    bundle = open_bundle(bundle_path, sources)
+
+    rent = bundle.get_dataframe("rent")
+    assert list(rent.columns) == ["kommun", "Relation", "Year", "Median Rent (SEK)"]
+    assert list(rent["kommun"].cat.categories) == ["Ale", "Lund"]
+    assert rent["Median Rent (SEK)"].tolist() == [0.0, 1000.0, 1100.0, 1200.0]
+    stats = bundle.get_dataframe("stats")
+    assert stats["kommun"].tolist() == ["Lund", "Ale"]
+    assert np.isnan(stats["Rank"][1])
+    assert bundle.get_json("mapping") == {"Skåne": ["Lund"], "Västra Götaland": ["Ale"]}
+
+
+def test_dataframe_isnt_copied(sources, tmp_path):
+    bundle_path = str(tmp_path / "bundle.bin")
+    build_bundle(bundle_path, sources)
+    bundle = DataBundle(bundle_path)
+
+    rent = bundle.get_dataframe("rent")
+    for column in ["Relation", "Year", "Median Rent (SEK)"]:
+        assert np.shares_memory(rent[column].to_numpy(), bundle.get_array("rent", column))
+    assert np.shares_memory(rent["kommun"].cat.codes.to_numpy(), bundle.get_array("rent", "kommun"))
+    # nothing can write to the bundle through the dataframe.
+    with pytest.raises(ValueError):
+        rent["Year"].to_numpy()[0] = 2000
+
+
+def test_missing_bundle(sources, tmp_path):
+    with pytest.raises(BundleError, match="python data_bundle.py"):
+        open_bundle(str(tmp_path / "bundle.bin"), sources)
+    assert not os.path.exists(tmp_path / "bundle.bin")  # opening never builds it.
+
+
+def test_out_of_date_bundle(sources, tmp_path):
+    bundle_path = str(tmp_path / "bundle.bin")
+    build_bundle(bundle_path, sources)
+    mapping_path = sources["mapping"][1]
+
+    # a changed file is found from its size/modification time, without reading it.
+    stat = os.stat(mapping_path)
+    os.utime(mapping_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    with pytest.raises(BundleError, match="mapping.json"):
+        open_bundle(bundle_path, sources)
+
+    old_content_hash = DataBundle(bundle_path).content_hash
+    (tmp_path / "mapping.json").write_text(json.dumps({"Skåne": ["Lund", "Malmö"]}))
+    build_bundle(bundle_path, sources)
+    assert open_bundle(bundle_path, sources).content_hash != old_content_hash
+    # as is a file being added to the bundle.
+    with pytest.raises(BundleError):
+        open_bundle(bundle_path, dict(sources, other=("json", mapping_path)))
+    os.remove(mapping_path)
+    with pytest.raises(BundleError):
+        open_bundle(bundle_path, sources)
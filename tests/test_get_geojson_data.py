@@ -0,0 +1,85 @@
+"""
+Tests for downloading the OSM polygons (get_geojson_data.py) and the rate limiting/retries
+it relies on (web_helpers.py), against a local stub server (see conftest.stub_server).
+"""
+import json
+import time
+import pytest
+from get_geojson_data import get_geojson_map
+from web_helpers import RateLimiter
+
+
+def polygon_body(relation: int) -> bytes:
+    """What polygons.openstreetmap.fr sends for a relation (a GeometryCollection of one MultiPolygon)."""
+    geometry = {"type": "MultiPolygon",
+                "coordinates": [[[[relation, 0], [relation + 1, 0], [relation, 1], [relation, 0]]]]}
+    return json.dumps({"type": "GeometryCollection", "geometries": [geometry]}).encode("utf-8")
+
+
+def url_pattern(server) -> str:
+    return server.url + "/get_geojson.py?id={relation}&params=0"
+
+
+def path(relation: int) -> str:
+    return f"/get_geojson.py?id={relation}&params=0"
+
+
+def test_get_geojson_map(stub_server):
+    relations = [11, 12, 13]
+    for relation in relations:
+        stub_server.routes[path(relation)] = [(200, polygon_body(relation), {})]
+
+    complete_map, fail_list = get_geojson_map(relations, url_pattern(stub_server), max_workers=3)
+    assert fail_list == []
+    assert complete_map["type"] == "FeatureCollection"
+    assert [feature["id"] for feature in complete_map["features"]] == relations
+    feature = complete_map["features"][0]
+    assert feature["type"] == "Feature"
+    assert feature["geometry"] == json.loads(polygon_body(11))["geometries"][0]
+
+
+def test_server_error_is_retried(stub_server):
+    stub_server.routes[path(11)] = [(503, b"Service Unavailable", {}), (200, polygon_body(11), {})]
+
+    complete_map, fail_list = get_geojson_map([11], url_pattern(stub_server))
+    assert fail_list == []
+    assert [feature["id"] for feature in complete_map["features"]] == [11]
+    assert [request[0] for request in stub_server.requests] == [path(11)] * 2
+
+
+def test_failures_are_collected(stub_server):
+    stub_server.routes[path(11)] = [(200, polygon_body(11), {})]
+    stub_server.routes[path(12)] = [(200, b"<html>not json</html>", {})]
+    stub_server.routes[path(13)] = [(200, b'{"type": "GeometryCollection"}', {})]
+    # 14 has no route, so gets a 404 (which isn't retried).
+
+    complete_map, fail_list = get_geojson_map([11, 12, 13, 14], url_pattern(stub_server))
+    assert [feature["id"] for feature in complete_map["features"]] == [11]
+    assert fail_list == [12, 13, 14]
+    assert len(stub_server.requests) == 4
+
+
+def test_requests_are_rate_limited(stub_server):
+    relations = list(range(10))
+    for relation in relations:
+        stub_server.routes[path(relation)] = [(200, polygon_body(relation), {})]
+
+    rate, burst = 20, 2  # get_geojson_map's burst is max_workers.
+    get_geojson_map(relations, url_pattern(stub_server), max_workers=burst, requests_per_second=rate)
+    times = sorted(request[2] for request in stub_server.requests)
+    for number, request_time in enumerate(times):
+        # the first requests can all go at once, the rest wait for a token.
+        assert request_time - times[0] >= (number - burst + 1) / rate - 0.02
+
+
+def test_rate_limiter_spacing():
+    rate_limiter = RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        rate_limiter.wait("http://example.com/page")
+    assert time.monotonic() - start == pytest.approx(5 / 50, abs=0.05)
+
+    # another host has its own bucket.
+    start = time.monotonic()
+    rate_limiter.wait("http://example.org/page")
+    assert time.monotonic() - start < 0.01
@@ -0,0 +1,131 @@
+"""
+Tests for scraping the kommun info texts (get_kommun_county_info.py), against a local stub server
+(see conftest.stub_server) serving the pages in "tests/fixtures".
+"""
+import json
+import os
+import pytest
+from get_kommun_county_info import (find_stale_kommuner, get_kommun_info_paragraph, get_kommun_url,
+                                    update_kommun_info)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as infile:
+        return infile.read()
+
+
+@pytest.fixture
+def info_pages(stub_server):
+    """Stub server with the info page of Malmö (after one 503) and a page without the paragraph for Lund."""
+    html = {"Content-Type": "text/html; charset=utf-8"}
+    stub_server.routes["/skane-lan/malmo"] = [(503, b"Service Unavailable", {}),
+                                              (200, read_fixture("kommun_page_malmo.html"), html)]
+    stub_server.routes["/skane-lan/lund"] = [(200, read_fixture("kommun_page_no_paragraph.html"), html)]
+    # Solna has no page, so gets a 404.
+    return stub_server
+
+
+def test_get_kommun_info_paragraph(info_pages):
+    url_pre = info_pages.url + "/"
+    kommuner_info, kommun_urls, fail_list = get_kommun_info_paragraph(
+        {"Skåne": ["Malmö", "Lund"], "Stockholm": ["Solna"]}, url_pre=url_pre, requests_per_second=50)
+
+    assert kommuner_info == {"Malmö": "Malmö is Sweden's third largest city and lies in Skåne, "
+                                      "in the far south of Sweden."}
+    assert kommun_urls == {"Malmö": url_pre + "skane-lan/malmo", "Lund": url_pre + "skane-lan/lund",
+                           "Solna": url_pre + "stockholms-lan/solna"}
+    assert fail_list == ["Lund", "Solna"]
+
+
+def test_retries_are_rate_limited(info_pages):
+    rate = 4
+    get_kommun_info_paragraph({"Skåne": ["Malmö", "Lund"], "Stockholm": ["Solna"]},
+                              url_pre=info_pages.url + "/", max_workers=1, requests_per_second=rate)
+    paths = [request[0] for request in info_pages.requests]
+    # only the 503 is retried (once), not the 404 or the page without a paragraph.
+    assert sorted(paths) == ["/skane-lan/lund", "/skane-lan/malmo", "/skane-lan/malmo",
+                             "/stockholms-lan/solna"]
+    # every request, the retry included, waits its turn with the rate limiter.
+    times = [request[2] for request in info_pages.requests]
+    assert all(later - earlier >= 1 / rate - 0.02 for earlier, later in zip(times, times[1:]))
+
+
+def info_page(paragraph: str) -> tuple:
+    """Response with a kommun info page, with this introductory paragraph."""
+    body = f'<html><body><h1>Kommun</h1><p class="ingress">{paragraph}</p></body></html>'
+    return 200, body.encode("utf-8"), {"Content-Type": "text/html; charset=utf-8"}
+
+
+# results of a previous run, Solna failed (so has no text).
+OLD_MAPPING = {"Skåne": ["Malmö", "Lund", "Ystad"], "Stockholm": ["Solna"]}
+OLD_TEXTS = {"Malmö": "Old Malmö text.", "Lund": "Old Lund text.", "Ystad": "Old Ystad text."}
+# Lund has moved county, Ystad has been removed and Nacka added.
+NEW_MAPPING = {"Skåne": ["Malmö"], "Halland": ["Lund"], "Stockholm": ["Solna", "Nacka"]}
+
+
+def old_urls(url_pre: str) -> dict:
+    return {kommun: get_kommun_url(county, kommun, url_pre)
+            for county, kommuner in OLD_MAPPING.items() for kommun in kommuner}
+
+
+def test_find_stale_kommuner():
+    url_pre = "https://example.com/"
+    assert find_stale_kommuner(NEW_MAPPING, OLD_MAPPING, OLD_TEXTS, old_urls(url_pre), url_pre) == [
+        "Lund", "Solna", "Nacka"]
+    assert find_stale_kommuner(OLD_MAPPING, OLD_MAPPING, dict(OLD_TEXTS, Solna="Solna text."),
+                               old_urls(url_pre), url_pre) == []
+    # a changed web address (e.g. the site moved) makes a kommun stale.
+    assert find_stale_kommuner(OLD_MAPPING, OLD_MAPPING, dict(OLD_TEXTS, Solna="Solna text."),
+                               old_urls("https://example.org/"), url_pre) == ["Malmö", "Lund", "Ystad", "Solna"]
+
+
+def test_incremental_update(stub_server, tmp_path):
+    url_pre = stub_server.url + "/"
+    assets_dir = tmp_path / "assets"
+    assets_dir.mkdir()
+    for name, data in [("county_kommun_mapping", OLD_MAPPING), ("kommun_info_texts", OLD_TEXTS),
+                       ("kommun_urls", old_urls(url_pre))]:
+        (assets_dir / f"{name}.json").write_text(json.dumps(data))
+    for path, kommun in [("/skane-lan/malmo", "Malmö"), ("/hallands-lan/lund", "Lund"),
+                         ("/stockholms-lan/solna", "Solna"), ("/stockholms-lan/nacka", "Nacka")]:
+        stub_server.routes[path] = [info_page(f"New {kommun} text.")]
+
+    fail_list = update_kommun_info(NEW_MAPPING, incremental=True, url_pre=url_pre,
+                                   assets_dir=str(assets_dir))
+    assert fail_list == []
+    # Malmö hasn't changed, so isn't downloaded again.
+    assert sorted(request[0] for request in stub_server.requests) == [
+        "/hallands-lan/lund", "/stockholms-lan/nacka", "/stockholms-lan/solna"]
+
+    def load(name):
+        return json.loads((assets_dir / f"{name}.json").read_text())
+    assert load("kommun_info_texts") == {"Malmö": "Old Malmö text.", "Lund": "New Lund text.",
+                                         "Solna": "New Solna text.", "Nacka": "New Nacka text."}
+    assert list(load("kommun_info_texts")) == ["Malmö", "Lund", "Solna", "Nacka"]  # mapping order.
+    assert load("kommun_urls") == {"Malmö": url_pre + "skane-lan/malmo", "Lund": url_pre + "hallands-lan/lund",
+                                   "Solna": url_pre + "stockholms-lan/solna",
+                                   "Nacka": url_pre + "stockholms-lan/nacka"}
+    assert load("county_kommun_mapping") == NEW_MAPPING
+    assert not [path for path in os.listdir(assets_dir) if path.endswith(".tmp")]
+
+    # nothing has changed now, so nothing is downloaded.
+    stub_server.requests.clear()
+    update_kommun_info(NEW_MAPPING, incremental=True, url_pre=url_pre, assets_dir=str(assets_dir))
+    assert stub_server.requests == []
+
+
+def test_failed_kommun_keeps_its_old_text(stub_server, tmp_path):
+    url_pre = stub_server.url + "/"
+    assets_dir = tmp_path / "assets"
+    assets_dir.mkdir()
+    (assets_dir / "kommun_info_texts.json").write_text(json.dumps(OLD_TEXTS))
+    # no mapping saved yet, so everything is stale, but only Malmö's page can be found.
+    stub_server.routes["/skane-lan/malmo"] = [info_page("New Malmö text.")]
+
+    fail_list = update_kommun_info(OLD_MAPPING, incremental=True, url_pre=url_pre,
+                                   assets_dir=str(assets_dir))
+    assert fail_list == ["Lund", "Ystad", "Solna"]
+    texts = json.loads((assets_dir / "kommun_info_texts.json").read_text())
+    assert texts == dict(OLD_TEXTS, Malmö="New Malmö text.")
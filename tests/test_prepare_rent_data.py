@@ -0,0 +1,46 @@
+"""
+Regression tests for prepare_rent_data.py, the tables it makes from the Statistics Sweden
+excel files must stay byte for byte the same as those in the "assets" folder.
+"""
+import filecmp
+import pytest
+import prepare_rent_data
+
+STAT_NAMES = list(prepare_rent_data.STAT_FILES)
+
+
+@pytest.fixture(scope="module")
+def processed_tables():
+    """Output of process_stat_data for every file in STAT_FILES."""
+    relation_tables = prepare_rent_data.load_relation_tables()
+    return {name: prepare_rent_data.process_stat_data(stat_path, kommun_or_county,
+                                                      relation_tables[kommun_or_county])
+            for name, (stat_path, kommun_or_county, _) in prepare_rent_data.STAT_FILES.items()}
+
+
+@pytest.mark.parametrize("name", STAT_NAMES)
+def test_cleaned_csv_matches_assets(processed_tables, tmp_path, name):
+    out_path = prepare_rent_data.STAT_FILES[name][2]
+    tmp_csv = tmp_path / "cleaned.csv"
+    prepare_rent_data.save_csv(processed_tables[name], str(tmp_csv))
+    assert filecmp.cmp(tmp_csv, out_path + ".csv", shallow=False)
+
+
+def test_stats_csv_matches_assets(processed_tables, tmp_path):
+    df_stats_kommun = prepare_rent_data.create_stats_table(
+        processed_tables["rent_kommun"], "kommun", df_county=processed_tables["rent_county"])
+    df_stats_county = prepare_rent_data.create_stats_table(
+        processed_tables["rent_county"], "county")
+    for df, path in [(df_stats_kommun, "assets/rent_stats_kommuner.csv"),
+                     (df_stats_county, "assets/rent_stats_counties.csv")]:
+        prepare_rent_data.save_csv(df, str(tmp_path / "stats.csv"))
+        assert filecmp.cmp(tmp_path / "stats.csv", path, shallow=False)
+
+
+def test_map_label_marks_missing_data(processed_tables):
+    df = processed_tables["rent_kommun"]
+    missing = df["Median Rent (SEK)"] <= 0
+    assert missing.any()
+    assert (df.loc[missing, "Map Label"] == "Missing Data").all()
+    assert (df.loc[~missing, "Map Label"] == "Median Cost: "
+            + df.loc[~missing, "Median Rent (SEK)"].astype(int).astype(str) + " SEK").all()
@@ -0,0 +1,91 @@
+"""
+Tests for pxweb_data.py, against the county annual rent table saved as PX-Web responses
+("tests/fixtures", one JSON-stat 2 and one PC-Axis file) as well as the excel export in "stats".
+"""
+import numpy as np
+import pandas as pd
+import pytest
+import prepare_rent_data
+import pxweb_data
+
+EXCEL_PATH = prepare_rent_data.STAT_FILES["rent_county"][0]
+
+
+@pytest.mark.parametrize("path", ["tests/fixtures/annual_rent_counties.json",
+                                  "tests/fixtures/annual_rent_counties.px"])
+def test_pxweb_file_matches_excel(path):
+    expected = prepare_rent_data.process_stat_data(EXCEL_PATH, "county")
+    pd.testing.assert_frame_equal(prepare_rent_data.process_stat_data(path, "county"), expected)
+
+
+def test_jsonstat_version_1_with_sparse_values():
+    data = {"dataset": {
+        "dimension": {
+            "id": ["Tid", "Region"], "size": [2, 2], "role": {"time": ["Tid"]},
+            "Tid": {"category": {"index": {"2016": 0, "2017": 1}}},
+            "Region": {"category": {"index": {"01": 0, "03": 1},
+                                    "label": {"01": "01 Stockholm county", "03": "03 Uppsala county"}}},
+        },
+        "value": {"0": 1, "2": 3, "3": 4},  # position 1 (Uppsala 2016) is missing.
+    }}
+    df, years = pxweb_data.read_jsonstat(data)
+    assert years == ["2016", "2017"]
+    assert list(df["Unnamed: 1"]) == ["01 Stockholm county", "03 Uppsala county"]
+    np.testing.assert_array_equal(df[years].to_numpy(), [[1, 3], [np.nan, 4]])
+
+
+def test_jsonstat_needs_selection_for_extra_variables():
+    data = {"id": ["Region", "ContentsCode", "Tid"], "size": [1, 2, 1],
+            "dimension": {"Region": {"category": {"index": ["01"]}},
+                          "ContentsCode": {"category": {"index": ["median", "mean"]}},
+                          "Tid": {"category": {"index": ["2016"]}}},
+            "value": [1, 2]}
+    with pytest.raises(ValueError, match="ContentsCode"):
+        pxweb_data.read_jsonstat(data)
+    df, _ = pxweb_data.read_jsonstat(data, selection={"ContentsCode": "mean"})
+    assert df["2016"].tolist() == [2]
+
+
+def test_px_missing_values_and_other_languages():
+    text = ('STUB="region";\nHEADING="year";\n'
+            'VALUES("region")="01 Stockholm county","03 Uppsala county";\n'
+            'VALUES[sv]("region")="01 Stockholms län","03 Uppsala län";\n'
+            'VALUES("year")="2016","2017";\nDATA=\n1 ".."\n"-" 4.5;\n')
+    df, years = pxweb_data.read_px(text)
+    assert years == ["2016", "2017"]
+    assert list(df["Unnamed: 1"]) == ["01 Stockholm county", "03 Uppsala county"]
+    np.testing.assert_array_equal(df[years].to_numpy(), [[1, np.nan], [np.nan, 4.5]])
+
+
+def test_px_wrong_number_of_values():
+    text = 'STUB="region";\nHEADING="year";\nVALUES("region")="01";\nVALUES("year")="2016","2017";\nDATA=\n1;\n'
+    with pytest.raises(ValueError, match="expected 2"):
+        pxweb_data.read_px(text)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('"a","b"', ["a", "b"]),
+    ('"Stockholm, county","Uppsala; county"', ["Stockholm, county", "Uppsala; county"]),
+    ('"first half, "\n"second half"', ["first half, second half"]),  # long string split over lines.
+    ('TLIST(A1)', ["TLIST(A1)"]),
+])
+def test_split_px_values(text, expected):
+    assert pxweb_data.split_px_values(text) == expected
+
+
+def test_px_keywords_with_semicolons_in_quotes():
+    keywords = pxweb_data.parse_px_keywords(
+        'TITLE="rent; by region, and year";\nVALUES("region")="a;b","c";\nNOTE[sv]="svensk";\n')
+    assert keywords == {("TITLE", None): '"rent; by region, and year"',
+                        ("VALUES", "region"): '"a;b","c"'}
+    assert pxweb_data.split_px_values(keywords[("VALUES", "region")]) == ["a;b", "c"]
+
+
+def test_build_query():
+    query = pxweb_data.build_query({"Region": "*", "Tid": ["2021", "2022"]}, "px")
+    assert query == {
+        "query": [{"code": "Region", "selection": {"filter": "all", "values": ["*"]}},
+                  {"code": "Tid", "selection": {"filter": "item", "values": ["2021", "2022"]}}],
+        "response": {"format": "px"},
+    }
+    assert pxweb_data.build_query({})["response"] == {"format": "json-stat2"}
@@ -0,0 +1,141 @@
+"""
+Tests for simplifying the map files (simplify_maps.py), on a tiny map of two neighbouring squares.
+"""
+import json
+import numpy as np
+import pytest
+import simplify_maps
+
+# Two unit squares side by side. The border they share bulges out to (1.2, 0.5), with two points
+# just off the straight line to the bulge, and each square has a point halfway along its top and bottom.
+SHARED_BORDER = [(1, 0), (1.1, 0.249), (1.2, 0.5), (1.1, 0.751), (1, 1)]
+LEFT_RING = [(0, 0), (0.5, 0)] + SHARED_BORDER + [(0.5, 1), (0, 1), (0, 0)]
+RIGHT_RING = [(1, 0), (1.5, 0), (2, 0), (2, 1), (1.5, 1)] + SHARED_BORDER[::-1]
+
+
+def two_squares() -> dict:
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": 1, "properties": {"name": "left"},
+         "geometry": {"type": "Polygon", "coordinates": [LEFT_RING]}},
+        {"type": "Feature", "id": 2, "properties": {"name": "right"},
+         "geometry": {"type": "MultiPolygon", "coordinates": [[RIGHT_RING]]}},
+    ]}
+
+
+def rings(geojson_map: dict) -> list:
+    """The only ring of each feature, as a list of (x, y) tuples."""
+    return [[tuple(point) for point in feature["geometry"]["coordinates"][0][0]]
+            for feature in geojson_map["features"]]
+
+
+def same_ring(ring, other_ring) -> bool:
+    """True if two closed rings have the same points in the same order, from any starting point."""
+    ring, other_ring = ring[:-1], other_ring[:-1]
+    if len(ring) != len(other_ring) or other_ring[0] not in ring:
+        return False
+    start = ring.index(other_ring[0])
+    return ring[start:] + ring[:start] == other_ring
+
+
+def test_douglas_peucker():
+    line = np.array([(0, 0), (1, 0.001), (2, 0), (3, 1), (4, 0)], dtype=float)
+    assert simplify_maps.douglas_peucker(line, 0.01).tolist() == [True, False, True, True, True]
+    assert simplify_maps.douglas_peucker(line, 2).tolist() == [True, False, False, False, True]
+
+
+def test_zero_tolerance_keeps_every_point():
+    line = np.array([(0, 0), (1, 0), (2, 0), (2, 2), (0, 2), (0, 0)], dtype=float)  # (1, 0) is on the line.
+    assert simplify_maps.douglas_peucker(line, 0).all()
+
+    assert rings(simplify_maps.simplify_map(two_squares(), 0, preserve_topology=False)) == [
+        LEFT_RING, RIGHT_RING]
+    # the rings are cut where the squares meet, so may start at a different point.
+    simplified = rings(simplify_maps.simplify_map(two_squares(), 0))
+    assert same_ring(simplified[0], LEFT_RING)
+    assert same_ring(simplified[1], RIGHT_RING)
+
+
+@pytest.mark.parametrize("preserve_topology", [True, False])
+def test_simplify_map(preserve_topology):
+    simplified_map = simplify_maps.simplify_map(two_squares(), 0.01, preserve_topology)
+    assert simplify_maps.count_points(two_squares()) == 20
+    assert simplify_maps.count_points(simplified_map) == 12
+
+    left, right = rings(simplified_map)
+    assert same_ring(left, [(0, 0), (1, 0), (1.2, 0.5), (1, 1), (0, 1), (0, 0)])
+    assert same_ring(right, [(1, 0), (2, 0), (2, 1), (1, 1), (1.2, 0.5), (1, 0)])
+    for ring in (left, right):
+        assert ring[0] == ring[-1]  # still closed.
+    # ids and properties are kept.
+    assert [(feature["id"], feature["properties"]) for feature in simplified_map["features"]] == [
+        (1, {"name": "left"}), (2, {"name": "right"})]
+
+
+def test_shared_border_still_lines_up():
+    for tolerance in (0.0001, 0.01, 0.05, 1):
+        left, right = rings(simplify_maps.simplify_map(two_squares(), tolerance))
+        # any point of the shared border kept in one square is kept in the other.
+        assert set(left) & set(SHARED_BORDER) == set(right) & set(SHARED_BORDER)
+
+
+def test_collapsed_ring_keeps_the_largest_polygon():
+    # a tiny island (which collapses) next to a square, both in one feature.
+    island = [(5, 5), (5.001, 5), (5.001, 5.001), (5, 5)]
+    square = [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)]
+    geojson_map = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": 1, "geometry": {"type": "MultiPolygon", "coordinates": [[island], [square]]}}]}
+    simplified_map = simplify_maps.simplify_map(geojson_map, 0.01)
+    assert simplified_map["features"][0]["geometry"]["coordinates"] == [[[list(point) for point in square]]]
+
+
+@pytest.mark.parametrize("quantization", [simplify_maps.QUANTIZATION, 1000])
+def test_topology_round_trip(quantization):
+    topology = simplify_maps.encode_topology(two_squares(), quantization)
+    decoded_map = simplify_maps.decode_topology(topology)
+
+    assert [(feature["id"], feature["properties"]) for feature in decoded_map["features"]] == [
+        (1, {"name": "left"}), (2, {"name": "right"})]
+    # every point comes back within one grid step of where it was (the map is 2 wide and 1 high).
+    max_error = np.array([2, 1]) / quantization
+    for ring, original_ring in zip(rings(decoded_map), [LEFT_RING, RIGHT_RING]):
+        assert ring[0] == ring[-1]
+        ring, original_ring = np.array(ring[:-1]), np.array(original_ring[:-1])
+        start = np.argmin(np.abs(original_ring - ring[0]).sum(axis=1))  # rings may start elsewhere.
+        assert np.all(np.abs(np.roll(original_ring, -start, axis=0) - ring) <= max_error)
+
+
+def test_shared_border_is_stored_once():
+    topology = simplify_maps.encode_topology(two_squares())
+    # the shared border and the rest of each square.
+    assert len(topology["arcs"]) == 3
+    left, right = [set(geometry["arcs"][0][0]) for geometry in topology["objects"]["map"]["geometries"]]
+    shared = [arc for arc in left if ~arc in right]
+    assert len(shared) == 1
+    shared_arc = np.cumsum(topology["arcs"][shared[0] if shared[0] >= 0 else ~shared[0]], axis=0)
+    assert len(shared_arc) == len(SHARED_BORDER)
+
+
+@pytest.mark.parametrize("map_name", ["kommuner", "counties"])
+def test_committed_topojson_matches_geojson(map_name):
+    # the TopoJSON the web-app loads is the committed low res geojson, to within one grid step.
+    with open(f"assets/{map_name}_map_low_res.json", "r") as json_file:
+        geojson_map = json.load(json_file)
+    with open(f"assets/{map_name}_map_low_res.topojson", "r") as json_file:
+        decoded_map = simplify_maps.decode_topology(json.load(json_file))
+
+    all_points = np.concatenate([np.asarray(ring, dtype=float) for feature in geojson_map["features"]
+                                 for polygon in simplify_maps.get_polygons(feature["geometry"])
+                                 for ring in polygon])
+    max_error = (all_points.max(axis=0) - all_points.min(axis=0)) / simplify_maps.QUANTIZATION
+    assert [feature["id"] for feature in decoded_map["features"]] == [
+        feature["id"] for feature in geojson_map["features"]]
+    for feature, decoded_feature in zip(geojson_map["features"], decoded_map["features"]):
+        polygons = simplify_maps.get_polygons(feature["geometry"])
+        decoded_polygons = decoded_feature["geometry"]["coordinates"]
+        assert [len(polygon) for polygon in decoded_polygons] == [len(polygon) for polygon in polygons]
+        for polygon, decoded_polygon in zip(polygons, decoded_polygons):
+            for ring, decoded_ring in zip(polygon, decoded_polygon):
+                ring, decoded_ring = np.array(ring[:-1]), np.array(decoded_ring[:-1])
+                assert ring.shape == decoded_ring.shape
+                start = np.argmin(np.abs(ring - decoded_ring[0]).sum(axis=1))
+                assert np.all(np.abs(np.roll(ring, -start, axis=0) - decoded_ring) <= max_error)
@@ -0,0 +1,93 @@
+"""
+Tests for the on-disk response cache of the web scraping scripts (web_helpers.py),
+against a local stub server (see conftest.stub_server).
+"""
+import json
+import os
+import pytest
+from web_helpers import CacheMissError, ResponseCache, fetch_url
+
+
+def etag_page(body: bytes, etag: str):
+    """Response that is only sent if the request doesn't already have this ETag, else a 304."""
+    def respond(request_headers):
+        if request_headers.get("If-None-Match") == etag:
+            return 304, b"", {"ETag": etag}
+        return 200, body, {"ETag": etag}
+    return respond
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path / "http_cache"))
+
+
+def test_unchanged_page_is_read_from_the_cache(stub_server, cache):
+    stub_server.routes["/page"] = [etag_page(b'{"a": 1}', '"v1"')]
+    url = stub_server.url + "/page"
+
+    assert fetch_url(url, cache=cache, parse=json.loads) == {"a": 1}
+    assert fetch_url(url, cache=cache, parse=json.loads) == {"a": 1}
+    sent_etags = [headers.get("If-None-Match") for _, headers, _ in stub_server.requests]
+    assert sent_etags == [None, '"v1"']
+
+
+def test_changed_page_replaces_the_cached_one(stub_server, cache):
+    stub_server.routes["/page"] = [etag_page(b"old", '"v1"'), etag_page(b"new", '"v2"')]
+    url = stub_server.url + "/page"
+
+    assert fetch_url(url, cache=cache) == b"old"
+    assert fetch_url(url, cache=cache) == b"new"
+    assert cache.get(url)[0] == b"new"
+    assert cache.get(url)[1]["etag"] == '"v2"'
+
+
+def test_offline_mode(stub_server, cache):
+    stub_server.routes["/page"] = [etag_page(b"cached", '"v1"')]
+    url = stub_server.url + "/page"
+    fetch_url(url, cache=cache)
+
+    offline_cache = ResponseCache(cache.cache_dir, offline=True)
+    assert fetch_url(url, cache=offline_cache) == b"cached"
+    with pytest.raises(CacheMissError):
+        fetch_url(stub_server.url + "/other", cache=offline_cache)
+    assert len(stub_server.requests) == 1
+
+
+def test_page_that_cant_be_read_isnt_cached(stub_server, cache):
+    stub_server.routes["/page"] = [etag_page(b"<html>not json</html>", '"v1"'),
+                                   etag_page(b'{"a": 1}', '"v2"')]
+    url = stub_server.url + "/page"
+
+    with pytest.raises(ValueError):
+        fetch_url(url, cache=cache, parse=json.loads)
+    assert cache.get(url) is None
+    # so the next request isn't conditional, and gets the page again.
+    assert fetch_url(url, cache=cache, parse=json.loads) == {"a": 1}
+    assert stub_server.requests[1][1].get("If-None-Match") is None
+
+
+def test_cached_page_that_cant_be_read_is_removed(stub_server, cache):
+    url = stub_server.url + "/page"
+    cache.put(url, b"<html>not json</html>", {"ETag": '"v1"'})  # e.g. cached before parse was used.
+    stub_server.routes["/page"] = [etag_page(b"<html>not json</html>", '"v1"')]
+
+    with pytest.raises(ValueError):
+        fetch_url(url, cache=cache, parse=json.loads)
+    assert cache.get(url) is None
+
+
+def test_half_saved_page_is_a_miss(stub_server, cache):
+    stub_server.routes["/page"] = [etag_page(b"old", '"v1"'), etag_page(b"new", '"v2"')]
+    url = stub_server.url + "/page"
+    fetch_url(url, cache=cache)
+
+    # as if saving a newer body was stopped before its headers were written.
+    with open(cache._path(url) + ".body", "wb") as outfile:
+        outfile.write(b"newer")
+    assert cache.get(url) is None
+    assert fetch_url(url, cache=cache) == b"new"
+    assert stub_server.requests[1][1].get("If-None-Match") is None
+
+    os.remove(cache._path(url) + ".json")
+    assert cache.get(url) is None
@@ -0,0 +1,313 @@
+"""
+Helper functions shared by the web scraping scripts
+(get_geojson_data.py and get_kommun_county_info.py).
+
+Allows many pages to be downloaded at once without overloading the sites
+they come from, retrying any requests that fail along the way.
+Downloaded pages can also be kept in a local cache, so re-running a script
+only re-downloads pages that have changed (or nothing at all in offline mode).
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+import pandas as pd
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter, safe to share between threads.
+    Each host gets its own bucket, so requests to one site don't slow down another.
+
+    Parameters
+    ----------
+    rate : float
+        Requests per second allowed for each host.
+
+    burst : int
+        Number of requests that can be made at once before the rate limit kicks in.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # host: (tokens left, time last updated)
+        self._lock = threading.Lock()
+
+    def wait(self, url: str) -> None:
+        """Block until a request can be made to the host of this url."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            tokens, last_update = self._buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last_update) * self.rate)
+            # take a token now, if there isn't one the wait time pays it back.
+            tokens -= 1
+            self._buckets[host] = (tokens, now)
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+class CacheMissError(OSError):
+    """Raised in offline mode when a url has not been downloaded before."""
+
+
+class ResponseCache:
+    """
+    Local on-disk cache of downloaded pages, keyed by url.
+    The ETag/Last-Modified headers are stored with each page so it can be re-requested
+    conditionally, if the page hasn't changed the server only needs to reply "304 Not Modified".
+    Each page is stored as two files, the body (".body") and then its url, headers and the hash
+    of the body (".json"). A page is only used if both files are there and match.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Folder to store the cached pages in.
+
+    offline : bool
+        If True, pages are only ever read from the cache and nothing is downloaded.
+    """
+
+    def __init__(self, cache_dir: str = ".http_cache", offline: bool = False):
+        self.cache_dir = cache_dir
+        self.offline = offline
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def get(self, url: str):
+        """
+        Return the cached (body, info) for a url, or None if it isn't cached
+        (or only half of it was saved, e.g. a new body with the headers of the old one).
+        """
+        try:
+            with open(self._path(url) + ".json", "r") as json_file:
+                info = json.load(json_file)
+            with open(self._path(url) + ".body", "rb") as infile:
+                body = infile.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        if info.get("url") != url or info.get("body_sha256") != hashlib.sha256(body).hexdigest():
+            return None
+        return body, info
+
+    def put(self, url: str, body: bytes, headers) -> None:
+        """
+        Store a downloaded page alongside its ETag/Last-Modified headers.
+        Only pages that were read successfully should be stored, or the server will keep
+        replying that the broken page hasn't changed.
+        """
+        info = {"url": url, "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "body_sha256": hashlib.sha256(body).hexdigest()}
+        # write to temporary files first, so a cached page is never half written.
+        # The headers go last, as they are what make the body count as cached.
+        for suffix, content in ((".body", body), (".json", json.dumps(info).encode("utf-8"))):
+            tmp_path = f"{self._path(url)}{suffix}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as outfile:
+                outfile.write(content)
+            os.replace(tmp_path, self._path(url) + suffix)
+
+    def remove(self, url: str) -> None:
+        """Remove a page from the cache (e.g. if it couldn't be read), if it is there."""
+        for suffix in (".json", ".body"):
+            try:
+                os.remove(self._path(url) + suffix)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def conditional_headers(info: dict) -> dict:
+        """Request headers asking the server to only send a page if it has changed."""
+        headers = {}
+        if info.get("etag"):
+            headers["If-None-Match"] = info["etag"]
+        if info.get("last_modified"):
+            headers["If-Modified-Since"] = info["last_modified"]
+        return headers
+
+
+def fetch_cached(url: str, send, cache: ResponseCache = None, parse=None):
+    """
+    Download a url through a cache.
+
+    Parameters
+    ----------
+    url : str
+        url to download.
+
+    send : callable
+        Function that makes the actual request, called as send(url, request_headers),
+        must return (status code, body, response headers).
+
+    cache : ResponseCache
+        Cache to use, if None the url is always downloaded.
+
+    parse : callable
+        Reads the body (e.g. json.loads), what it returns is returned instead of the body.
+        A page is only cached once it has been read without an error, and a cached page
+        that can't be read is removed from the cache (so it is downloaded again next time).
+
+    Returns
+    -------
+    bytes
+        Body of the response (or of the cached page if it hasn't changed), or what parse returned.
+    """
+    if parse is None:
+        def parse(body):
+            return body
+    if cache is None:
+        return parse(send(url, {})[1])
+
+    def parse_cached(body):
+        try:
+            return parse(body)
+        except Exception:
+            cache.remove(url)
+            raise
+
+    cached = cache.get(url)
+    if cache.offline:
+        if cached is None:
+            raise CacheMissError(f"{url} is not in the cache (offline mode).")
+        return parse_cached(cached[0])
+
+    request_headers = cache.conditional_headers(
+        cached[1]) if cached is not None else {}
+    status, body, headers = send(url, request_headers)
+    if status == 304 and cached is not None:
+        return parse_cached(cached[0])
+    result = parse(body)
+    if status == 200:
+        cache.put(url, body, headers)
+    return result
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Helper function to decide if a failed request is worth trying again.
+    Server errors, rate limiting and connection problems are, anything else
+    (e.g. 404 Not Found, or a page missing from the cache) will fail again.
+    Works for both urllib errors and requests errors (which are also OSErrors).
+    """
+    if isinstance(error, HTTPError):
+        status = error.code
+    else:
+        response = getattr(error, "response", None)  # set on requests' HTTPError.
+        status = response.status_code if response is not None else None
+    if status is not None:
+        return status >= 500 or status == 429
+    return isinstance(error, (URLError, OSError)) and not isinstance(error, CacheMissError)
+
+
+def fetch_with_retries(url: str, send, cache: ResponseCache = None, max_retries: int = 3,
+                       backoff: float = 1.0, parse=None):
+    """
+    Download a url through a cache (see fetch_cached), retrying with an exponential backoff
+    if it fails. This is the only place requests are retried, so every attempt goes through
+    send (and so through any rate limiter it waits on).
+
+    Parameters
+    ----------
+    url : str
+        url to download.
+
+    send : callable
+        See fetch_cached. Must raise an OSError (e.g. HTTPError) for an error response.
+
+    cache : ResponseCache
+        Cache to read from/store the page in, if given.
+
+    max_retries : int
+        Number of times to try again after the first attempt fails.
+
+    backoff : float
+        Seconds to wait before the first retry, doubled for every retry after.
+
+    parse : callable
+        See fetch_cached, errors it raises aren't retried.
+
+    Returns
+    -------
+    bytes
+        Body of the response, or what parse returned.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return fetch_cached(url, send, cache, parse)
+        except OSError as error:  # includes URLError, HTTPError and requests' errors.
+            if attempt == max_retries or not is_retryable(error):
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def fetch_url(url: str, rate_limiter: RateLimiter = None, max_retries: int = 3,
+              backoff: float = 1.0, timeout: float = 60, cache: ResponseCache = None,
+              data: bytes = None, content_type: str = "application/json", parse=None):
+    """
+    Download a url, retrying with an exponential backoff if it fails.
+
+    Parameters
+    ----------
+    url : str
+        url to download.
+
+    rate_limiter : RateLimiter
+        Shared rate limiter to wait on before each attempt, if given.
+
+    max_retries : int
+        Number of times to try again after the first attempt fails.
+
+    backoff : float
+        Seconds to wait before the first retry, doubled for every retry after.
+
+    timeout : float
+        Seconds to wait for the server before giving up on an attempt.
+
+    cache : ResponseCache
+        Cache to read from/store the page in, if given.
+
+    data : bytes
+        If given, sent as the body of a POST request (e.g. a PX-Web query).
+        The cache is keyed by url only, so POST requests are never cached.
+
+    content_type : str
+        Content-Type header of the POST request body.
+
+    parse : callable
+        See fetch_cached.
+
+    Returns
+    -------
+    bytes
+        Body of the response, or what parse returned.
+    """
+    if data is not None:
+        cache = None
+
+    def send(url, request_headers):
+        if rate_limiter is not None:
+            rate_limiter.wait(url)
+        if data is not None:
+            request_headers = dict(request_headers, **{"Content-Type": content_type})
+        try:
+            with urlopen(Request(url, data=data, headers=request_headers), timeout=timeout) as response:
+                return response.status, response.read(), response.headers
+        except HTTPError as error:
+            if error.code == 304:
+                return error.code, b"", error.headers
+            raise
+
+    return fetch_with_retries(url, send, cache, max_retries, backoff, parse)
+
+
+def read_html_tables(body: bytes) -> list:
+    """Read the tables of a downloaded html page (use as fetch_url's parse, so only pages with tables are cached)."""
+    return pd.read_html(io.StringIO(body.decode("utf-8")))